@@ -2,47 +2,37 @@ import datetime
 import itertools
 import sys
 import collections
-from io import BytesIO, StringIO
+from io import StringIO
 from pathlib import Path
 
 from beastling import __version__
 import beastling.beast_maps as beast_maps
 from beastling.util import xml
-
-
-def indent(elem, level=0):
-    i = "\n" + level*"  "
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + "  "
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for elem in elem:
-            indent(elem, level+1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
+from beastling.fileio.datareaders import stdin_buffer, shard_files
+from beastling.util.fileio import open_file
 
 
 def collect_ids_and_refs(root):
     data = dict(id=collections.Counter(), idref=collections.Counter())
     parent_map = {c: p for p in root.iter() for c in p}
+
+    def expand(e, value):
+        # Substitute the values of the variables of all plates containing the element.
+        values = [value]
+        while e in parent_map:
+            e = parent_map[e]
+            if e.tag == 'plate':
+                var = '$({0})'.format(e.get('var'))
+                values = [v.replace(var, x) for v in values for x in e.get('range').split(',')]
+        return values
+
     for e in root.iter():
         for attrib, value in e.items():
             for attr, collection in data.items():
                 if attrib == attr:
-                    if e in parent_map and parent_map[e].tag == 'plate':
-                        # Quick and dirty plate handling.
-                        # We only support plate matching in direct children of the plate.
-                        var = parent_map[e].get('var')
-                        for id_ in parent_map[e].get('range').split(','):
-                            collection.update([value.replace('$({0})'.format(var), id_)])
-                    else:
-                        collection.update([value])
+                    collection.update(expand(e, value))
             if (attrib not in data) and value.startswith("@"):
-                data['idref'].update([value[1:]])
+                data['idref'].update(expand(e, value[1:]))
     return data
 
 
@@ -61,9 +51,23 @@ class BeastXml(object):
             model.beastxml = self
         for clock in self.config.clocks:
             clock.beastxml = self
+        # Maps frozensets of languages to the IDs of the TaxonSets defined for them:
         self._taxon_sets = {}
-        self.build_xml()
-        self.validate_ids()
+        # IDs and references are registered while the XML is built, and duplicate IDs are
+        # reported right away:
+        self.ids = xml.IdRegistry()
+        with self.ids.activate():
+            self.build_xml()
+        # Objects may be referenced before they are defined, though.
+        self.check_refs(self.ids.dangling_refs())
+
+    def _in_sections(self, components):
+        """
+        Iterate over models or clocks, attributing the IDs created meanwhile to them.
+        """
+        for component in components:
+            with self.ids.section('{0} {1}'.format(component.__class__.__name__, component.name)):
+                yield component
 
     def build_xml(self):
         """
@@ -89,10 +93,10 @@ class BeastXml(object):
         self.add_beastling_comment()
         self.embed_data()
         self.add_maps()
-        for model in self.config.models:
+        for model in self._in_sections(self.config.models):
             model.add_master_data(self.beast)
             model.add_misc(self.beast)
-        for clock in self.config.clocks:
+        for clock in self._in_sections(self.config.clocks):
             clock.add_branchrate_model(self.beast)
         self.add_run()
 
@@ -129,16 +133,22 @@ class BeastXml(object):
             for filename in self.config.files_to_embed:
                 self.beast.append(self.format_data_file(filename))
             for model in self.config.models:
-                self.beast.append(self.format_data_file(model.data_filename))
+                # Sharded data sources are embedded file by file.
+                for filename in shard_files(model.data_filename) or [model.data_filename]:
+                    self.beast.append(self.format_data_file(filename))
 
     def format_data_file(self, filename):
         """
         Return an ElementTree node corresponding to a comment containing
         the text of the specified data file.
         """
-        return xml.comment("\n".join([
-            "BEASTling embedded data file: %s" % filename,
-            Path(filename).read_text(encoding='utf8')]))
+        if str(filename) == 'stdin':
+            text = stdin_buffer().read()
+        else:
+            # Compressed data files are embedded decompressed.
+            with open_file(filename, encoding='utf8') as fp:
+                text = fp.read()
+        return xml.comment("\n".join(["BEASTling embedded data file: %s" % filename, text]))
 
     def add_maps(self):
         """
@@ -213,9 +223,9 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         """
         self.state = xml.state(self.run, id="state", storeEvery="5000")
         self.config.treeprior.add_state_nodes(self)
-        for clock in self.config.clocks:
+        for clock in self._in_sections(self.config.clocks):
             clock.add_state(self.state)
-        for model in self.config.all_models:
+        for model in self._in_sections(self.config.all_models):
             model.add_state(self.state)
 
     def add_init(self):
@@ -249,9 +259,9 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         self.add_monophyly_constraints()
         self.add_calibrations()
         self.config.treeprior.add_prior(self)
-        for clock in self.config.clocks:
+        for clock in self._in_sections(self.config.clocks):
             clock.add_prior(self.prior)
-        for model in self.config.all_models:
+        for model in self._in_sections(self.config.all_models):
             model.add_prior(self.prior)
 
     def add_monophyly_constraints(self):
@@ -312,16 +322,17 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         define_taxa=True will define, rather than refer to, the taxa.
         """
         # Kill duplicates
-        langs = sorted(list(set(langs)))
+        taxa = frozenset(langs)
 
         # If we've been asked to build an emtpy TaxonSet, something is very wrong,
         # so better to die loud and early
-        assert langs
-        # Refer to any previous TaxonSet with the same languages
-        for idref, taxa in self._taxon_sets.items():
-            if langs == taxa:
-                xml.taxonset(parent, idref=idref)
-                return
+        assert taxa
+        # Refer to any previous TaxonSet with the same languages - TaxonSets are looked up by
+        # their set of languages, so this is cheap, however many TaxonSets there are.
+        if taxa in self._taxon_sets:
+            xml.taxonset(parent, idref=self._taxon_sets[taxa])
+            return
+        langs = sorted(taxa)
         if len(langs) == 1 and label == langs[0]:
             # Single taxa are IDs already. They cannot also be taxon set ids.
             label = "tx_{:}".format(label)
@@ -336,7 +347,7 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         else:
             for lang in langs:
                 xml.taxon(taxonset, attrib={"id" if define_taxa else "idref" : lang})
-        self._taxon_sets[label] = langs
+        self._taxon_sets[taxa] = label
 
     def add_likelihood(self):
         """
@@ -344,7 +355,7 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         """
         self.likelihood = xml.distribution(
             self.posterior, id="likelihood", spec="util.CompoundDistribution")
-        for model in self.config.all_models:
+        for model in self._in_sections(self.config.all_models):
             model.add_likelihood(self.likelihood)
 
     def add_operators(self):
@@ -352,9 +363,9 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         Add all <operator> elements.
         """
         self.add_tree_operators()
-        for clock in self.config.clocks:
+        for clock in self._in_sections(self.config.clocks):
             clock.add_operators(self.run)
-        for model in self.config.all_models:
+        for model in self._in_sections(self.config.all_models):
             model.add_operators(self.run)
         # Add one DeltaExchangeOperator for feature rates per clock
         for clock in self.config.clocks:
@@ -429,9 +440,9 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         if self.config.admin.log_params:
             # Log tree metadata
             self.config.treeprior.add_logging(self, tracer_logger)
-            for clock in self.config.clocks:
+            for clock in self._in_sections(self.config.clocks):
                 clock.add_param_logs(tracer_logger)
-            for model in self.config.all_models:
+            for model in self._in_sections(self.config.all_models):
                 model.add_param_logs(tracer_logger)
 
         # Log calibration clade heights
@@ -528,37 +539,52 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
                 xml.log(trait_logger, idref=reference)
 
     def validate_ids(self):
+        """
+        Check the IDs and references of the whole document - including elements added after the
+        document was built, which are not known to `self.ids`.
+        """
         data = collect_ids_and_refs(self.beast)
         duplicate_ids = {id_ for id_, count in data['id'].most_common() if count > 1}
         if duplicate_ids:
             raise ValueError("Duplicate BEASTObject IDs found: " + ", ".join(sorted(duplicate_ids)))
+        self.check_refs(set(data['idref']) - set(data['id']))
 
-        bad_refs = set(data['idref']) - set(data['id'])
+    @staticmethod
+    def check_refs(bad_refs):
         if bad_refs:
-            raise ValueError("References to missing BEASTObject IDs found: " + ", ".join(bad_refs))
+            raise ValueError(
+                "References to missing BEASTObject IDs found: " + ", ".join(sorted(bad_refs)))
 
-    def tostring(self):
+    def tostring(self, compact=False):
         """
         Return a string representation of the entire XML document.
+
+        :param compact: If `True`, the document is not indented.
+        """
+        return b''.join(xml.iterencode(self.beast, pretty_print=not compact))
+
+    def write(self, stream, compact=False):
         """
-        out = BytesIO()
-        self.write(out)
-        out.seek(0)
-        return out.read()
+        Write the XML document to a binary stream - pretty-printed unless `compact` is `True`.
 
-    def write(self, stream):
-        indent(self.beast)
-        tree = xml.ElementTree(self.beast)
-        tree.write(stream, encoding='UTF-8', xml_declaration=True)
+        The document is serialized incrementally and written in chunks, without modifying the
+        element tree or building the serialization in memory first.
+        """
+        xml.write(self.beast, stream, pretty_print=not compact)
 
-    def write_file(self, filename=None):
+    def write_file(self, filename=None, compact=False):
         """
         Write the XML document to a file.
+
+        If the filename has a suffix indicating compression - e.g. `.xml.gz` - the document is
+        compressed while it is written.
+
+        :param compact: If `True`, the document is not indented.
         """
         if filename in ("stdout", "-"):
             # See https://docs.python.org/3/library/sys.html#sys.stdout
-            self.write(getattr(sys.stdout, 'buffer', sys.stdout))
+            self.write(getattr(sys.stdout, 'buffer', sys.stdout), compact=compact)
         else:
             filename = Path(filename) if filename else self.config.admin.path(".xml")
-            with filename.open("wb") as stream:
-                self.write(stream)
+            with open_file(filename, "wb") as stream:
+                self.write(stream, compact=compact)
@@ -49,8 +49,14 @@ def main(*args):
         help="Save a list of languages in the analysis as a plain text file.")
     parser.add_argument(
         "-o", "--output",
-        help="Output filename, for example `-o analysis.xml`",
+        help="Output filename, for example `-o analysis.xml`.  The XML is compressed if the "
+             "filename ends with `.gz`, `.xz` or `.bz2`, for example `-o analysis.xml.gz`.",
         default=None)
+    parser.add_argument(
+        "--compact",
+        help="Write the XML without indentation.",
+        default=False,
+        action="store_true")
     parser.add_argument(
         "--overwrite",
         help="Overwrite an existing configuration file.",
@@ -61,6 +67,12 @@ def main(*args):
         help="Read data from stdin.",
         default=False,
         action="store_true")
+    parser.add_argument(
+        "-j", "--jobs",
+        help="Number of worker processes used to load data files concurrently, overriding the "
+             "jobs option of the [admin] section.",
+        default=None,
+        type=int)
     parser.add_argument(
         "--prior", "--sample-from-prior", "-p",
         help="Generate XML file which samples from the prior, not posterior.",
@@ -113,7 +125,8 @@ def do_generate(args):
     # This is fast, and gives us enough information to check whether or not
     try:
         config = Configuration(
-            configfile=args.config, stdin_data=args.stdin, prior=args.prior, force_glottolog_load=args.report)
+            configfile=args.config, stdin_data=args.stdin, prior=args.prior,
+            force_glottolog_load=args.report, jobs=args.jobs)
     except wrap_errors as e: # PRAGMA: NO COVER
         exit(msg="Error encountered while parsing configuration file:", status=2, exception=True)
 
@@ -138,7 +151,7 @@ def do_generate(args):
         exit(msg="Error encountered while building BeastXML object:", status=3, exception=True)
 
     # Write XML file
-    xml.write_file(output_filename)
+    xml.write_file(output_filename, compact=args.compact)
 
     # Build and write report
     if args.report:
@@ -4,17 +4,18 @@ from pathlib import Path
 from configparser import ConfigParser
 
 import newick
-from csvw.dsv import reader
 from appdirs import user_data_dir
 
-from beastling.fileio.datareaders import iterlocations
+from beastling.fileio.datareaders import load_locations, preload_matrices, clear_matrix_cache
 import beastling.clocks.random as random_clock
 
 import beastling.models.geo as geo
+from beastling.models.basemodel import BaseModel
 
 from beastling import sections
 from beastling.util import log
 from beastling.util import monophyly
+from beastling.util import glottolog
 from beastling.util.misc import retrieve_url
 
 import beastling.treepriors.base as treepriors
@@ -63,7 +64,8 @@ class Configuration(object):
     for all options.
     """
 
-    def __init__(self, basename="beastling", configfile=None, stdin_data=False, prior=False, force_glottolog_load=False):
+    def __init__(self, basename="beastling", configfile=None, stdin_data=False, prior=False,
+                 force_glottolog_load=False, jobs=None):
         """
         Set all options to their default values and then, if a configuration
         file has been provided, override the default values for those options
@@ -90,9 +92,13 @@ class Configuration(object):
         # Glottolog data
         self.glottolog_loaded = False
         self.force_glottolog_load = force_glottolog_load
-        self.classifications = {}
+        self.classifications = glottolog.Classifications()
         self.glotto_macroareas = {}
         self.locations = {}
+        # Glottolog nodes classified under the configured families and the inverted clade index of
+        # the analysis languages, computed when first needed:
+        self._family_nodes = None
+        self._clade_index = None
 
         # Options set from the command line interface
         self.prior = prior
@@ -194,9 +200,14 @@ class Configuration(object):
         if self.mcmc.path_sampling:
             log.dependency("Path sampling", "MODEL_SELECTION")
 
+        try:
+            self.instantiate_models()
+        finally:
+            # All data files are loaded now, and the models hold their own copies of the data.
+            clear_matrix_cache()
         self.load_glottolog_data()
         self.load_user_geo()
-        self.instantiate_models()
+        self.add_language_code_maps()
         self.build_language_filter()
         self.process_models()
         self.build_language_list()
@@ -264,9 +275,10 @@ class Configuration(object):
 
     def load_glottolog_data(self):
         """
-        Loads the Glottolog classification information from the appropriate
-        newick file, parses it and stores the required datastructure in
-        self.classification.
+        Loads the Glottolog classification information and geographic metadata
+        (from a compiled snapshot of the appropriate newick and geo files) and
+        stores the required datastructures in self.classifications,
+        self.glotto_macroareas and self.locations.
         """
         # Don't load if the analysis doesn't use it
         if not self.check_glottolog_required():
@@ -277,48 +289,40 @@ class Configuration(object):
             return
         self.glottolog_loaded = True
 
-        self.classifications, glottocode2node, label2name = monophyly.classifications_from_newick(
-           str(get_glottolog_data('newick', self.admin.glottolog_release)))
-
-        # Load geographic metadata
-        dialects = []
-        for t in reader(
-                get_glottolog_data('geo', self.admin.glottolog_release), dicts=True):
-            identifiers = [t['glottocode']] +t['isocodes'].split()
-            if t['level'] == "dialect":
-                dialects.append((t, identifiers))
-            if t['macroarea']:
-                for id_ in identifiers:
-                    self.glotto_macroareas[id_] = t['macroarea']
-
-            if t['latitude'] and t['longitude']:
-                latlon = (float(t['latitude']), float(t['longitude']))
-                for id_ in identifiers:
-                    self.locations[id_] = latlon
-
-        # Second pass of geographic data to handle dialects, which inherit
-        # their parent language's location
-        for t, identifiers in dialects:
-            failed = False
-            if t['glottocode'] not in glottocode2node:  # pragma: no cover
-                # This may only happen for newick downloads of older Glottolog releases, where
-                # possibly isolates may not be included.
-                continue
-            node = glottocode2node[t['glottocode']]
-            ancestor = node.ancestor
-            while label2name[ancestor.name][1] not in self.locations:
-                if not ancestor.ancestor:
-                    # We've hit the root without finding an ancestral node
-                    # with location data!
-                    failed = True
-                    break
-                else:
-                    ancestor = ancestor.ancestor
-            if failed:
-                continue
-            latlon = self.locations[label2name[ancestor.name][1]]
-            for id_ in identifiers:
-                self.locations[id_] = latlon
+        snapshot = glottolog.load_snapshot(
+            get_glottolog_data('newick', self.admin.glottolog_release),
+            get_glottolog_data('geo', self.admin.glottolog_release),
+            self.admin.glottolog_release,
+            identifiers=self.glottolog_identifiers())
+        self.classifications = snapshot['classifications']
+        self.glotto_macroareas = snapshot['macroareas']
+        self.locations = snapshot['locations']
+
+    def glottolog_identifiers(self):
+        """
+        Collect all identifiers which may need to be looked up in Glottolog, i.e. the
+        languages in the data and all clades referenced in the configuration.
+
+        Glottolog classifications only need to be loaded for the families containing these.
+        Returns None if all of Glottolog is required.
+        """
+        if not self.models:
+            # A geography-only analysis starts with all languages in Glottolog
+            return None
+        identifiers = set(self.languages.languages) | set(self.languages.families)
+        for model in self.models:
+            identifiers.update(model.data.keys())
+            identifiers.update(model.language_code_map.values())
+        clades = list(self.calibration_configs)
+        for specification in self.language_group_configs.values():
+            clades.extend(specification)
+        if self.geography:
+            clades.extend(self.geography.sampling_points)
+        for clade in clades:
+            if clade.lower().startswith("originate(") and clade.endswith(")"):
+                clade = clade[10:-1]
+            identifiers.update(c.strip() for c in clade.split(","))
+        return identifiers
 
     def check_glottolog_required(self):
         # We need Glottolog if...
@@ -340,8 +344,32 @@ class Configuration(object):
     def load_user_geo(self):
         if self.geography:
             # Read location data from file, patching (rather than replacing) Glottolog
-            for loc_file in self.geography.data:
-                self.locations.update(dict(iterlocations(loc_file)))
+            for locations in load_locations(
+                    self.geography.data,
+                    jobs=self.admin.jobs,
+                    encoding=self.geography.encoding,
+                    delimiter=self.geography.delimiter):
+                self.locations.update(locations)
+
+    def add_language_code_maps(self):
+        """
+        Augment the Glottolog data with human-friendly language names which
+        may have been read from a CLDF dataset.
+        """
+        # Note that we store both the actual language ID and its lowercase
+        # transformation.  This is kind of ugly, but we inconsistently convert
+        # things to lowercase before doing Glottolog lookups all over the
+        # place, so this is the easiest way to make this work everywhere.  We
+        # should clean this up some day!
+        for model in self.models:
+            for language_id, glottocode in model.language_code_map.items():
+                if glottocode in self.classifications:
+                    self.classifications.add_alias(language_id, glottocode)
+                    self.classifications.add_alias(language_id.lower(), glottocode)
+                for data in [self.glotto_macroareas, self.locations]:
+                    if glottocode in data:
+                        data[language_id] = data[glottocode]
+                        data[language_id.lower()] = data[language_id]
 
     def build_language_filter(self):
         """
@@ -360,7 +388,12 @@ class Configuration(object):
 
         # Enforce minimum data constraint
         all_langs = set(itertools.chain(*[model.data.keys() for model in self.models]))
-        N = sum([max([len(lang.keys()) for lang in model.data.values()]) for model in self.models])
+        # Every model has a - possibly empty - row of data for every language.
+        for model in self.models:
+            model.matrix.add_languages(all_langs)
+        N = sum([
+            max([len(lang.keys()) for lang in model.data.values()], default=0)
+            for model in self.models])
         datapoint_props = {}
         for lang in all_langs:
             count = 0
@@ -380,10 +413,11 @@ class Configuration(object):
     def filter_language(self, l):
         if self.languages.languages and l not in self.languages.languages:
             return False
-        if self.languages.families and not any(
-                name in self.languages.families or glottocode in self.languages.families
-                for (name, glottocode) in self.classifications.get(l,[])):
-            return False
+        if self.languages.families:
+            if self._family_nodes is None:
+                self._family_nodes = self.classifications.descendants(self.languages.families)
+            if self.classifications.nodes.get(l) not in self._family_nodes:
+                return False
         if self.languages.macroareas and self.glotto_macroareas.get(l,None) not in self.languages.macroareas:
             return False
         if self.languages.exclusions and l in self.languages.exclusions:
@@ -435,8 +469,8 @@ class Configuration(object):
             end = start + self.languages.monophyly_levels
         elif self.languages.monophyly_direction == "bottom_up":
             # Compute start and end in a bottom-up fashion
-            classifications = [self.classifications[name.lower()] for name in langs]
-            end = max([len(c) for c in classifications]) - self.languages.monophyly_start_depth
+            end = max([self.classifications.depth(name.lower()) for name in langs]) \
+                - self.languages.monophyly_start_depth
             start = max(0, end - self.languages.monophyly_levels)
         struct = monophyly.make_structure(self.classifications, langs, depth=start, maxdepth=end)
         # Make sure this struct is not pointlessly flat
@@ -469,8 +503,15 @@ class Configuration(object):
         # Handle request to read data from stdin
         if self.stdin_data:
             for config in self.models:
-                config["data"] = "stdin"
-
+                config.data = "stdin"
+
+        # Data files are loaded concurrently up front if requested; the models then pick up the
+        # loaded data - one after another, so errors are raised for the right model section.
+        if self.admin.jobs > 1:
+            preload_matrices(
+                [(config.data, BaseModel.load_options(config, self))
+                 for config in self.models if config.data is not None],
+                jobs=self.admin.jobs)
         self.models = [model.get_model(self) for model in self.models]
 
         if self.geography:
@@ -763,14 +804,11 @@ class Configuration(object):
         clades = clades - matched_clades
 
         if clades:
-            # Now search against Glottolog
-            clades = [c.lower() for c in clades]
-            for l in self.languages.languages:
-                # No repeated matching!
-                if l not in langs:
-                    for name, glottocode in self.classifications.get(l.lower(), ""):
-                        if name.lower() in clades or glottocode in clades:
-                            langs.add(l)
-                            break
+            # Now search against Glottolog. Language groups are only looked up once the list of
+            # languages is final, so the index of their clades can be built once.
+            if self._clade_index is None:
+                self._clade_index = self.classifications.clade_index(self.languages.languages)
+            for c in clades:
+                langs = langs.union(self._clade_index.get(c.lower(), set()))
 
         return list(langs)
@@ -2,6 +2,8 @@ import xml.etree.ElementTree as ET
 from pathlib import Path
 from configparser import ConfigParser
 
+from beastling.util.fileio import open_file
+
 # The standard library XML parser does not give access to comments, which we
 # need.  The following extended parser remedies this.  # Code taken from
 # https://stackoverflow.com/a/27333347, which was in turn based on Fredrik Lundh's
@@ -26,9 +28,13 @@ class CommentParser(ET.TreeBuilder):
 
 
 def read_comments(filename):
+    """
+    Read the top-level comments of a - possibly compressed - XML file.
+    """
     parser = CommentParser.get_parser()
-    with open(str(filename), "rb") as fp:
-        parser.feed(fp.read())
+    with open_file(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            parser.feed(chunk)
     return [e for e in parser.close() if e.tag == ET.Comment]
 
 
@@ -80,6 +86,7 @@ def write_data_file(comment_text, overwrite):
         return "Embedded data file %s already exists!  Run beastling with the --overwrite option if you wish to overwrite it.\n" % filename
     if not filename.parent.exists():
         filename.parent.mkdir()
-    with filename.open("w", encoding='utf8') as fp:
+    # Data files which were compressed are written compressed again.
+    with open_file(filename, "w", encoding='utf8') as fp:
         fp.write("\n".join(lines[1:]))
     return "Wrote embedded data file %s.\n" % filename
@@ -0,0 +1,323 @@
+"""
+Compact storage of the data of a model.
+"""
+import array
+import collections.abc
+
+__all__ = ['DataMatrix', 'MISSING']
+
+# Code of a cell without data for a feature in a language.
+MISSING = -1
+
+
+class DataMatrix(object):
+    """
+    Language x feature matrix of integer codes.
+
+    Each cell of the matrix is a tuple of values.  The distinct cells of a feature are stored
+    once, in a per-feature cell table, and the matrix - a flat array in row-major order - stores
+    the index of a cell in this table, or `MISSING` if there is no data for the feature in a
+    language.
+
+    Cell tables are ragged arrays: The distinct values of a feature are interned in
+    `self.names`, and the values of cell `i` of a feature are the value codes
+    `flat[offsets[i]:offsets[i + 1]]`.  Thus, multi-valued cells - e.g. sets of cognate classes -
+    cost a few bytes per value rather than a Python object each.
+    """
+    # The per-feature tables making up the cell tables:
+    _tables = ['names', '_names', 'offsets', 'flat', '_codes']
+
+    def __init__(self, languages=(), features=()):
+        self.languages = list(languages)
+        self.features = list(features)
+        self.rows = {lang: i for i, lang in enumerate(self.languages)}
+        self.columns = {feature: i for i, feature in enumerate(self.features)}
+        # Flags signaling whether the cell table of a column may be modified in place, i.e. is
+        # not shared with copies of the matrix.
+        self._owned = [True for _ in self.features]
+        for name in self._tables:
+            setattr(self, name, [None for _ in self.features])
+        for col in range(len(self.features)):
+            self._clear(col)
+        self.codes = array.array('i', [MISSING]) * (len(self.languages) * len(self.features))
+
+    def _clear(self, col):
+        self.names[col] = []
+        # Maps values to value codes:
+        self._names[col] = {}
+        self.offsets[col] = array.array('i', [0])
+        self.flat[col] = array.array('i')
+        # Maps the value codes of cells - serialized as bytes - to cell codes, built on demand:
+        self._codes[col] = {}
+        self._owned[col] = True
+
+    def _index(self, col):
+        if self._codes[col] is None:
+            offsets, flat = self.offsets[col], self.flat[col]
+            self._codes[col] = {
+                flat[offsets[i]:offsets[i + 1]].tobytes(): i for i in range(len(offsets) - 1)}
+        return self._codes[col]
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a matrix from a `dict` mapping languages to `dict`s mapping features to lists of
+        values, as returned by `beastling.fileio.datareaders.load_data`.
+        """
+        features = {}
+        for row in data.values():
+            for feature in row:
+                features.setdefault(feature, None)
+        res = cls(data.keys(), features)
+        # While loading, cells are looked up by their values, which are kept by `data` anyway.
+        cells = [{} for _ in res.features]
+        for i, row in enumerate(data.values()):
+            for feature, values in row.items():
+                col = res.columns[feature]
+                key = tuple(values)
+                if key not in cells[col]:
+                    cells[col][key] = res._append(col, values)
+                res.codes[i * len(res.features) + col] = cells[col][key]
+        # The index of the cells is only rebuilt if cells are added again.
+        res._codes = [None for _ in res.features]
+        return res
+
+    def copy(self):
+        """
+        A copy of the matrix, sharing the cell tables with this matrix until they are modified.
+        """
+        res = DataMatrix()
+        res.languages, res.features = list(self.languages), list(self.features)
+        res.rows, res.columns = dict(self.rows), dict(self.columns)
+        for name in self._tables:
+            setattr(res, name, list(getattr(self, name)))
+        res.codes = array.array('i', self.codes)
+        res._owned = [False for _ in self.features]
+        self._owned = [False for _ in self.features]
+        return res
+
+    def _own(self, col):
+        if not self._owned[col]:
+            self.names[col], self._names[col] = list(self.names[col]), dict(self._names[col])
+            self.offsets[col] = array.array('i', self.offsets[col])
+            self.flat[col] = array.array('i', self.flat[col])
+            self._codes[col] = None if self._codes[col] is None else dict(self._codes[col])
+            self._owned[col] = True
+
+    def view(self, missing='?'):
+        """
+        A read-only mapping of languages to mappings of features to lists of values.
+
+        :param missing: The value returned for features without data for a language - like the \
+        `defaultdict`s data used to be read into.
+        """
+        return DataView(self, missing)
+
+    def code(self, feature, values):
+        """
+        The code of a cell in the cell table of a feature, adding the cell if necessary.
+        """
+        col = self.columns[feature]
+        names = self._names[col]
+        if all(v in names for v in values):
+            key = array.array('i', [names[v] for v in values]).tobytes()
+            if key in self._index(col):
+                return self._codes[col][key]
+        # A cell with a new value is a new cell, too.
+        self._own(col)
+        code = self._append(col, values)
+        self._index(col)[self.cell_values(feature, code).tobytes()] = code
+        return code
+
+    def _append(self, col, values):
+        """
+        Add a cell to a cell table - without updating the index of cells.
+        """
+        names = self._names[col]
+        for v in values:
+            if v not in names:
+                names[v] = len(self.names[col])
+                self.names[col].append(v)
+        self.flat[col].extend([names[v] for v in values])
+        self.offsets[col].append(len(self.flat[col]))
+        return len(self.offsets[col]) - 2
+
+    def set(self, lang, feature, values):
+        self.codes[self.rows[lang] * len(self.features) + self.columns[feature]] = \
+            self.code(feature, values)
+
+    def value_code(self, feature, value):
+        """
+        The code of a value of a feature, or `None` if the value does not occur.
+        """
+        return self._names[self.columns[feature]].get(value)
+
+    def cell_values(self, feature, code):
+        """
+        The value codes of a cell of a feature, as `array`.
+        """
+        col = self.columns[feature]
+        return self.flat[col][self.offsets[col][code]:self.offsets[col][code + 1]]
+
+    def cells(self, feature):
+        """
+        The cell table of a feature, as list of `tuple`s of values, indexed by cell code.
+        """
+        col = self.columns[feature]
+        names, offsets, flat = self.names[col], self.offsets[col], self.flat[col]
+        return [
+            tuple(names[v] for v in flat[offsets[i]:offsets[i + 1]])
+            for i in range(len(offsets) - 1)]
+
+    def cell(self, lang, feature):
+        """
+        The values for a feature in a language, as `tuple`, or `None` if there is no data.
+        """
+        code = self.codes[self.rows[lang] * len(self.features) + self.columns[feature]]
+        if code == MISSING:
+            return None
+        names = self.names[self.columns[feature]]
+        return tuple(names[v] for v in self.cell_values(feature, code))
+
+    def column(self, feature):
+        """
+        The codes of a feature for all languages, in the order of `self.languages`.
+        """
+        return self.codes[self.columns[feature]::len(self.features)]
+
+    def bincount(self, feature):
+        """
+        Count the languages with each cell of a feature.
+
+        :return: pair (list of counts, indexed by cell code; number of languages without data)
+        """
+        # MISSING codes are counted in the extra last slot.
+        counts = [0] * len(self.offsets[self.columns[feature]])
+        for code in self.column(feature):
+            counts[code] += 1
+        return counts[:-1], counts[-1]
+
+    def value_counts(self, feature):
+        """
+        Count the occurrences of each value of a feature across all languages.
+
+        :return: list of counts, indexed by value code
+        """
+        col = self.columns[feature]
+        offsets, flat = self.offsets[col], self.flat[col]
+        counts = [0] * len(self.names[col])
+        for code, n in enumerate(self.bincount(feature)[0]):
+            if n:
+                for v in flat[offsets[code]:offsets[code + 1]]:
+                    counts[v] += n
+        return counts
+
+    def row(self, lang):
+        """
+        The codes of all features for a language, in the order of `self.features`.
+        """
+        start = self.rows[lang] * len(self.features)
+        return self.codes[start:start + len(self.features)]
+
+    def select(self, languages=None, features=None):
+        """
+        Restrict the matrix to a subset of its languages and features, preserving their order.
+        """
+        if languages is not None:
+            languages = set(languages)
+            languages = [lang for lang in self.languages if lang in languages]
+        else:
+            languages = self.languages
+        if features is not None:
+            features = set(features)
+            features = [feature for feature in self.features if feature in features]
+        else:
+            features = self.features
+        columns = [self.columns[feature] for feature in features]
+        codes = array.array('i')
+        for lang in languages:
+            row = self.row(lang)
+            codes.extend(row[col] for col in columns)
+        for name in self._tables + ['_owned']:
+            table = getattr(self, name)
+            setattr(self, name, [table[col] for col in columns])
+        self.languages, self.features, self.codes = languages, features, codes
+        self.rows = {lang: i for i, lang in enumerate(self.languages)}
+        self.columns = {feature: i for i, feature in enumerate(self.features)}
+
+    def add_languages(self, languages):
+        """
+        Add rows without any data for languages not yet in the matrix.
+        """
+        for lang in languages:
+            if lang not in self.rows:
+                self.rows[lang] = len(self.languages)
+                self.languages.append(lang)
+                self.codes.extend([MISSING] * len(self.features))
+
+    def recode(self, feature, func):
+        """
+        Replace each cell `c` of a feature with `func(c)`, by rewriting the cell table.
+        """
+        col = self.columns[feature]
+        cells = self.cells(feature)
+        self._clear(col)
+        new = [self.code(feature, func(cell)) for cell in cells]
+        for i in range(col, len(self.codes), len(self.features)):
+            if self.codes[i] != MISSING:
+                self.codes[i] = new[self.codes[i]]
+
+
+class DataView(collections.abc.Mapping):
+    """
+    Read-only mapping of languages to their data in a `DataMatrix`.
+    """
+    def __init__(self, matrix, missing='?'):
+        self.matrix = matrix
+        self.missing = missing
+
+    def __getitem__(self, lang):
+        if lang not in self.matrix.rows:
+            raise KeyError(lang)
+        return LanguageView(self.matrix, lang, self.missing)
+
+    def __iter__(self):
+        return iter(self.matrix.languages)
+
+    def __len__(self):
+        return len(self.matrix.languages)
+
+
+class LanguageView(collections.abc.Mapping):
+    """
+    Read-only mapping of the features with data for a language to lists of values.
+
+    Like a `defaultdict`, the mapping returns `missing` for features without data, but does not
+    contain them.
+    """
+    def __init__(self, matrix, lang, missing='?'):
+        self.matrix = matrix
+        self.lang = lang
+        self.missing = missing
+
+    def _cell(self, feature):
+        return self.matrix.cell(self.lang, feature) if feature in self.matrix.columns else None
+
+    def __getitem__(self, feature):
+        cell = self._cell(feature)
+        return self.missing if cell is None else list(cell)
+
+    def __contains__(self, feature):
+        return self._cell(feature) is not None
+
+    def get(self, feature, default=None):
+        cell = self._cell(feature)
+        return default if cell is None else list(cell)
+
+    def __iter__(self):
+        for feature, code in zip(self.matrix.features, self.matrix.row(self.lang)):
+            if code != MISSING:
+                yield feature
+
+    def __len__(self):
+        return sum(1 for code in self.matrix.row(self.lang) if code != MISSING)
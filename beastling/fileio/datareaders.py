@@ -1,7 +1,18 @@
+import os
 import csv
 import sys
+import glob
+import json
+import sqlite3
+import shutil
 import typing
+import hashlib
+import tempfile
+import logging
+import functools
+import contextlib
 import collections
+import concurrent.futures
 from pathlib import Path
 import chardet
 import warnings
@@ -9,28 +20,67 @@ import warnings
 import pycldf.dataset
 from pathlib import Path
 
-from csvw.dsv import UnicodeDictReader
+from appdirs import user_data_dir
+from csvw.dsv import UnicodeDictReader, UnicodeReader
+from csvw.metadata import TableGroup
 
 from beastling.util import log
+from beastling.util.fileio import (
+    is_compressed, uncompressed_name, open_file, COMPRESSION,
+)
+from beastling.fileio.datamatrix import DataMatrix
 
+# Number of data files kept in the cache of `load_matrix`.
+CACHE_SIZE = 16
+_cache = collections.OrderedDict()
 
-def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel):
+
+def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel,
+          encoding=None, delimiter=None):
     """Read the beginning of the file and guess its csv dialect.
 
+    Sniffed dialects are cached in the user data directory, keyed by the
+    hash of the first block of the file - i.e. of the data the sniffer looks
+    at - so the same file is not sniffed twice.
+
     Parameters
     ----------
     filename: str or pathlib.Path
         Path to a csv file to be sniffed
+    encoding: str
+        Encoding of the file, if known
+    delimiter: str
+        Delimiter of the file, if known - in which case no sniffing is done
 
     Returns
     -------
     csv.Dialect
     """
-    with Path(filename).open("rb") as fp:
+    if delimiter:
+        return make_dialect(delimiter=delimiter, encoding=encoding)
+
+    with open_file(filename, "rb") as fp:
+        key = hashlib.sha1(fp.read(SNIFF_BLOCK_SIZE)).hexdigest()
+    cache = sniffer_cache()
+    if key not in cache:
+        dialect = _sniff(filename, default_dialect, encoding)
+        if dialect is default_dialect:
+            return dialect
+        cache[key] = {
+            attr: getattr(dialect, attr) for attr in
+            ['delimiter', 'quotechar', 'doublequote', 'skipinitialspace', 'lineterminator',
+             'quoting', 'escapechar', 'encoding']}
+        write_sniffer_cache(cache)
+    return make_dialect(**dict(cache[key], encoding=encoding or cache[key]['encoding']))
+
+
+def _sniff(filename, default_dialect, encoding):
+    # Compressed files are sniffed from the first decompressed blocks.
+    with open_file(filename, "rb") as fp:
         # On large files, csv.Sniffer seems to need a lot of data to make a
         # successful inference...
-        sample = fp.read(1024)
-        encoding = chardet.detect(sample)["encoding"]
+        sample = fp.read(SNIFF_BLOCK_SIZE)
+        encoding = encoding or chardet.detect(sample)["encoding"]
         sample = sample.decode(encoding)
         while True:
             try:
@@ -38,7 +88,7 @@ def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel):
                 dialect.encoding = encoding
                 return dialect
             except csv.Error: # pragma: no cover
-                blob = fp.read(1024).decode(encoding)
+                blob = fp.read(SNIFF_BLOCK_SIZE).decode(encoding)
                 sample += blob
                 if not blob:
                     # If blob is emtpy we've somehow hit the end of the file
@@ -50,6 +100,113 @@ def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel):
                     raise
 
 
+@contextlib.contextmanager
+def _source(filename, encoding):
+    """
+    Context manager providing what to pass to a csvw reader to read a file: The file name, or -
+    for compressed files - a text stream decompressing the file while it is read.
+    """
+    if isinstance(filename, (str, Path)) and is_compressed(filename):
+        with open_file(filename, 'rt', encoding=encoding, newline='') as fp:
+            yield fp
+    else:
+        yield filename
+
+
+def make_dialect(delimiter, encoding=None, **kw):
+    """
+    Create a csv dialect.
+
+    :param delimiter: Delimiter character, or "tab".
+    :param kw: Additional `csv.Dialect` attributes.
+    """
+    attrs = dict(
+        csv.excel.__dict__,
+        delimiter="\t" if delimiter.lower() in ("tab", "\\t") else delimiter,
+        encoding=encoding)
+    attrs.update(kw)
+    return type('dialect', (csv.Dialect,), attrs)
+
+
+# Number of files for which sniffed dialects are cached.
+SNIFFER_CACHE_SIZE = 1000
+# Size of the blocks read by the sniffer.
+SNIFF_BLOCK_SIZE = 1024
+_sniffer_cache = None
+
+
+def sniffer_cache_path():
+    return Path(user_data_dir('beastling')) / 'sniffer-cache.json'
+
+
+def read_sniffer_cache():
+    try:
+        with sniffer_cache_path().open(encoding='utf8') as fp:
+            res = json.load(fp)
+        if isinstance(res, dict):
+            return res
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def sniffer_cache():
+    global _sniffer_cache
+    if _sniffer_cache is None:
+        _sniffer_cache = read_sniffer_cache()
+    return _sniffer_cache
+
+
+def write_sniffer_cache(cache):
+    """
+    Write the sniffer cache, merged with the entries written by other processes in the meantime.
+
+    The cache is written to a temporary file, which then replaces the cache file, so concurrent
+    readers never see a partially written cache.
+    """
+    for key, value in read_sniffer_cache().items():
+        cache.setdefault(key, value)
+    while len(cache) > SNIFFER_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    path, tmp = sniffer_cache_path(), None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'w', encoding='utf8', dir=str(path.parent), prefix=path.name, suffix='.tmp',
+                delete=False) as fp:
+            tmp = fp.name
+            json.dump(cache, fp)
+        os.replace(tmp, str(path))
+    except OSError as e:  # pragma: no cover
+        log.info("Could not write sniffer cache {0}: {1}".format(path, e))
+        if tmp:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+
+# Size of the data read from stdin above which it is spooled to a temporary file.
+STDIN_SPOOL_SIZE = 16 * 1024 * 1024
+_stdin = None
+
+
+def stdin_buffer():
+    """
+    The data read from stdin, as text file positioned at the start.
+
+    stdin is read only once per process - into a buffer, which is kept in memory unless it is
+    larger than `STDIN_SPOOL_SIZE` - so the data can be read by multiple models and embedded in
+    the XML.
+    """
+    global _stdin
+    if _stdin is None or _stdin[0] is not sys.stdin:
+        buffer = tempfile.SpooledTemporaryFile(
+            max_size=STDIN_SPOOL_SIZE, mode='w+', encoding='utf8', newline='')
+        shutil.copyfileobj(sys.stdin, buffer)
+        _stdin = (sys.stdin, buffer)
+    _stdin[1].seek(0)
+    return _stdin[1]
+
+
 def sanitise_name(name):
     """
     Take a name for a language or a feature which has come from somewhere like
@@ -59,32 +216,114 @@ def sanitise_name(name):
     return name.replace(" ", "_")
 
 
-def load_data(filename, file_format=None, lang_column=None, value_column=None, expect_multiple=False):
+def shard_files(filename):
+    """
+    The files of a sharded data source, i.e. a directory or a glob pattern.
+
+    :return: Sorted list of the (non-hidden) files in the directory or matching the pattern, or \
+        `None` if `filename` is not a sharded data source.
+    """
+    path = Path(str(filename))
+    if str(filename) == 'stdin' or path.is_file():
+        return None
+    if path.is_dir():
+        paths = path.iterdir()
+    elif glob.has_magic(str(path)):
+        paths = (Path(p) for p in glob.glob(str(path)))
+    else:
+        return None
+    return sorted(p for p in paths if p.is_file() and not p.name.startswith('.'))
+
+
+def cldf_metadata(filename):
+    """
+    The metadata file of a CLDF dataset in a directory.
+
+    :return: Path of the metadata file, or `None` if `filename` is not a directory containing a \
+        CLDF metadata file.
+    """
+    path = Path(str(filename))
+    if not path.is_dir():
+        return None
+    metadata = sorted(
+        p for p in path.iterdir() if uncompressed_name(p).name.endswith('-metadata.json'))
+    if len(metadata) > 1:
+        raise ValueError("Directory {0} contains multiple CLDF metadata files".format(filename))
+    return metadata[0] if metadata else None
+
+
+def load_data(filename, file_format=None, lang_column=None, value_column=None,
+              expect_multiple=False, features=None, exclusions=None, languages=None,
+              encoding=None, delimiter=None, jobs=1):
+    """
+    Load a data file.
+
+    The feature and language filters are applied while streaming the file, so only the requested
+    columns and rows are stored.  Languages with data in a file are included - possibly without
+    any features - unless they are excluded by the language filter.
+
+    :param features: Optional container of the features to load; `None` means all features.
+    :param exclusions: Optional container of features not to load.
+    :param languages: Optional container of the languages to load; `None` means all languages.
+    :param encoding: Optional encoding of a CSV file, overriding the sniffed encoding.
+    :param delimiter: Optional delimiter of a CSV file - if given, the file is not sniffed.
+    :param jobs: Maximal number of worker processes reading the shards of a sharded data source.
+    :return: pair (data, language_code_map)
+
+    Files compressed with gzip, xz or bzip2 - recognized by the suffixes `.gz`, `.xz` and `.bz2` -
+    are decompressed while reading; the format of such files is determined by the name without
+    this suffix.
+
+    `filename` may also be a directory or a glob pattern, in which case the files in the directory
+    or matching the pattern - e.g. one file per language family - are loaded as shards of one
+    data source, concurrently if `jobs` > 1.  Each language must be contained in only one shard.
+    Directories containing a CLDF metadata file are read as CLDF dataset.
+    """
+    filename = cldf_metadata(filename) or filename
+    shards = None if file_format and file_format.lower() == 'cldf' and Path(filename).is_dir() \
+        else shard_files(filename)
+    if shards is not None:
+        return _load_shards(
+            filename, shards, jobs,
+            file_format=file_format, lang_column=lang_column, value_column=value_column,
+            expect_multiple=expect_multiple, features=features, exclusions=exclusions,
+            languages=languages, encoding=encoding, delimiter=delimiter)
+
     # Handle CSV dialect issues
     if str(filename) == 'stdin':
-        filename = sys.stdin
+        filename = stdin_buffer()
         # We can't sniff from stdin, so guess comma-delimited and hope for
         # the best
-        dialect = "excel" # Default dialect for csv module
+        dialect = make_dialect(delimiter) if delimiter else "excel" # Default dialect for csv module
     elif file_format and file_format.lower() == "cldf":
-        return read_cldf_dataset(filename, value_column, expect_multiple=expect_multiple)
+        return read_cldf_dataset(
+            filename, value_column, expect_multiple=expect_multiple,
+            features=features, exclusions=exclusions, languages=languages)
+    elif file_format and file_format.lower() == "cldf-sqlite":
+        return read_cldf_sqlite(
+            filename, value_column, expect_multiple=expect_multiple,
+            features=features, exclusions=exclusions, languages=languages)
     elif file_format and file_format.lower() == "cldf-legacy":
         # CLDF pre-1.0 standard says delimiter is indicated by file extension
-        if filename.suffix.lower() == ".csv" or str(filename) == "stdin":
+        if uncompressed_name(filename).suffix.lower() == ".csv":
             dialect = "excel"
-        elif filename.suffix.lower() == ".tsv":
+        elif uncompressed_name(filename).suffix.lower() == ".tsv":
             dialect = "excel-tab"
         else:
             raise ValueError("CLDF standard dictates that filenames must end in .csv or .tsv")
-    elif filename.suffix == ".json" or filename.name in {"forms.csv", "values.csv"}:
+    elif uncompressed_name(filename).suffix == ".json" \
+            or uncompressed_name(filename).name in {"forms.csv", "values.csv"}:
         # TODO: Should we just let the pycldf module try its hands on the file
         # and fall back to other formats if that doesn't work?
-        return read_cldf_dataset(filename, value_column, expect_multiple=expect_multiple)
+        return read_cldf_dataset(
+            filename, value_column, expect_multiple=expect_multiple,
+            features=features, exclusions=exclusions, languages=languages)
     else:
         # Use CSV dialect sniffer in all other cases
-        dialect = sniff(filename)
+        dialect = sniff(filename, encoding=encoding, delimiter=delimiter)
     # Read
-    with UnicodeDictReader(filename, dialect=dialect) as reader:
+    with _source(filename, encoding or 'utf-8-sig') as source, UnicodeDictReader(
+            source, dialect=dialect, **({'encoding': encoding} if encoding else {})) as reader:
         # Guesstimate file format if user has not been explicit
         if file_format is None:
             file_format = 'cldf-legacy' if all(
@@ -93,18 +332,184 @@ def load_data(filename, file_format=None, lang_column=None, value_column=None, e
                 ) else 'beastling'
 
         # Load data
+        filters = dict(features=features, exclusions=exclusions, languages=languages)
         if file_format == 'cldf-legacy':
-            data = load_cldf_data(reader, value_column, filename, expect_multiple=expect_multiple)
+            data = load_cldf_data(
+                reader, value_column, filename, expect_multiple=expect_multiple, **filters)
         elif file_format == 'beastling':
-            data = load_beastling_data(reader, lang_column, filename, expect_multiple=expect_multiple)
+            data = load_beastling_data(
+                reader, lang_column, filename, expect_multiple=expect_multiple, **filters)
         else:
             raise ValueError("File format specification '{:}' not understood".format(file_format))
     return data, {}
 
+
+def _load_shards(filename, shards, jobs, **kw):
+    if not shards:
+        raise ValueError("No data files found for data source {0}".format(filename))
+    load = functools.partial(_load_shard, **kw)
+    data, language_code_map = {}, {}
+    with contextlib.ExitStack() as stack:
+        if jobs < 2 or len(shards) < 2:
+            results = ((load(shard), []) for shard in shards)
+        else:
+            pool = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(min(jobs, len(shards))))
+            results = pool.map(functools.partial(_in_worker, load), shards)
+        # Shards are merged in order, so errors are raised for the first offending shard.
+        for shard, ((shard_data, shard_code_map), records) in zip(shards, results):
+            _log_records(records)
+            for lang, row in shard_data.items():
+                if lang in data:
+                    raise ValueError(
+                        "Duplicated language identifier '%s' found in data file %s" % (lang, shard))
+                data[lang] = row
+            language_code_map.update(shard_code_map)
+    return data, language_code_map
+
+
+def _load_shard(filename, **kw):
+    data, language_code_map = load_data(filename, **kw)
+    # Plain `dict`s, to be passed between processes:
+    return {lang: dict(row) for lang, row in data.items()}, language_code_map
+
+
+def load_matrix(filename, **kw):
+    """
+    Load a data file as `DataMatrix`.
+
+    Data files are only parsed once until the cache is cleared with `clear_matrix_cache`: Results
+    are cached - keyed by the resolved path, modification time and size of the file - or the stdin
+    buffer - and the arguments passed to `load_data` - and each call gets a copy-on-write copy of
+    the cached matrix, which can be modified freely.
+
+    :param kw: Keyword arguments passed into `load_data`.
+    :return: pair (DataMatrix, language_code_map)
+    """
+    key = _cache_key(filename, kw)
+    if key in _cache:
+        _cache.move_to_end(key)
+    else:
+        _cache_matrix(key, _load_matrix(filename, kw))
+    matrix, language_code_map = _cache[key]
+    return matrix.copy(), dict(language_code_map)
+
+
+def _cache_key(filename, kw):
+    if str(filename) == 'stdin':
+        # Data read from stdin is buffered for the whole process.
+        key = ('stdin', id(stdin_buffer()))
+    else:
+        key, shards = (), shard_files(filename)
+        for path in [filename] if shards is None else shards:
+            path = Path(path).resolve()
+            stat = path.stat()
+            key += (str(path), stat.st_mtime_ns, stat.st_size)
+    # The number of jobs does not change the data.
+    return key + tuple(
+        (k, frozenset(v) if isinstance(v, (set, list)) else v) for k, v in sorted(kw.items())
+        if k != 'jobs')
+
+
+def clear_matrix_cache():
+    """
+    Release the data matrices cached by `load_matrix`.
+    """
+    _cache.clear()
+
+
+def _cache_matrix(key, value):
+    _cache[key] = value
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _load_matrix(filename, kw):
+    data, language_code_map = load_data(filename, **kw)
+    return DataMatrix.from_dict(data), language_code_map
+
+
+class _LogRecorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+def _in_worker(func, *args):
+    # Messages are recorded - to be logged by the main process - rather than emitted here.
+    logger, recorder = log.get_logger(), _LogRecorder()
+    level, propagate = logger.level, logger.propagate
+    logger.addHandler(recorder)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        return func(*args), recorder.records
+    finally:
+        logger.removeHandler(recorder)
+        logger.setLevel(level)
+        logger.propagate = propagate
+
+
+def _load_matrix_in_worker(filename, kw):
+    return _in_worker(_load_matrix, filename, kw)
+
+
+def _log_records(records):
+    for level, msg in records:
+        log.get_logger().log(level, msg)
+
+
+def preload_matrices(requests, jobs=1):
+    """
+    Load data files into the cache of `load_matrix` concurrently, in a pool of worker processes.
+
+    The results - and the messages logged by the workers - are collected in the order of
+    `requests`, so the outcome does not depend on how the workers are scheduled.  Errors are not
+    raised here: A file which could not be loaded is simply not cached, thus the error is raised
+    by the `load_matrix` call for this file.  Data from stdin is never preloaded, and at most
+    `CACHE_SIZE` files are.
+
+    :param requests: Sequence of pairs (filename, `dict` of keyword arguments for `load_matrix`).
+    :param jobs: Maximal number of worker processes.
+    """
+    todo = collections.OrderedDict()
+    for filename, kw in requests:
+        if str(filename) == 'stdin':
+            continue
+        try:
+            key = _cache_key(filename, kw)
+        except OSError:
+            continue
+        if key not in _cache and len(todo) < CACHE_SIZE:
+            todo.setdefault(key, (filename, kw))
+    if jobs < 2 or len(todo) < 2:
+        return
+    with concurrent.futures.ProcessPoolExecutor(min(jobs, len(todo))) as pool:
+        # The workers read the shards of sharded data sources one after another.
+        futures = [
+            (key, pool.submit(_load_matrix_in_worker, filename, dict(kw, jobs=1)))
+            for key, (filename, kw) in todo.items()]
+        for key, future in futures:
+            try:
+                value, records = future.result()
+            except Exception:
+                continue
+            _log_records(records)
+            _cache_matrix(key, value)
+
+
 _language_column_names = ("iso", "iso_code", "glotto", "glottocode", "language", "language_id", "lang", "lang_id")
 
 
-def load_beastling_data(reader, lang_column, filename, expect_multiple=False):
+def _wanted(name, features, exclusions):
+    return (features is None or name in features) and not (exclusions and name in exclusions)
+
+
+def load_beastling_data(reader, lang_column, filename, expect_multiple=False,
+                        features=None, exclusions=None, languages=None):
     if not lang_column:
         for candidate in reader.fieldnames:
             if candidate.lower() in _language_column_names:
@@ -113,19 +518,36 @@ def load_beastling_data(reader, lang_column, filename, expect_multiple=False):
 
     if not lang_column or lang_column not in reader.fieldnames:
         raise ValueError("Cold not find language column in data file %s" % filename)
+    lang_index = reader.fieldnames.index(lang_column)
+    # Only the requested columns are picked from the raw rows.
+    columns = [
+        (i, name) for i, name in enumerate(reader.fieldnames)
+        if i != lang_index and _wanted(name, features, exclusions)]
     data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
-    for row in reader:
-        if row[lang_column] in data:
-            raise ValueError("Duplicated language identifier '%s' found in data file %s" % (row[lang_column], filename))
-        lang = row.pop(lang_column)
+    seen = set()
+    for row in reader.reader:
+        if not row:
+            continue
+        if lang_index >= len(row):
+            raise ValueError("Missing language identifier in line %s of data file %s" % (
+                reader.reader.line_num, filename))
+        lang = row[lang_index]
+        if lang in seen:
+            raise ValueError(
+                "Duplicated language identifier '%s' found in data file %s" % (lang, filename))
+        seen.add(lang)
+        if languages is not None and lang not in languages:
+            continue
+        values = ((name, row[i] if i < len(row) else None) for i, name in columns)
         if expect_multiple:
-            data[lang] = collections.defaultdict(lambda : "?", {key: [value] for key, value in row.items()})
+            data[lang] = collections.defaultdict(lambda : "?", {key: [value] for key, value in values})
         else:
-            data[lang] = collections.defaultdict(lambda : "?", row)
+            data[lang] = collections.defaultdict(lambda : "?", values)
     return data
 
 
-def load_cldf_data(reader, value_column, filename, expect_multiple=False):
+def load_cldf_data(reader, value_column, filename, expect_multiple=False,
+                   features=None, exclusions=None, languages=None):
     value_column = value_column or "Value"
     if "Feature_ID" in reader.fieldnames:
         feature_column = "Feature_ID"
@@ -136,11 +558,15 @@ def load_cldf_data(reader, value_column, filename, expect_multiple=False):
     data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
     for row in reader:
         lang = row["Language_ID"]
+        if languages is not None and lang not in languages:
+            continue
         if lang not in data:
             if expect_multiple:
                 data[lang] = collections.defaultdict(lambda: [])
             else:
                 data[lang] = collections.defaultdict(lambda: "?")
+        if not _wanted(row[feature_column], features, exclusions):
+            continue
         if expect_multiple:
             data[lang][row[feature_column]].append(row[value_column])
         else:
@@ -148,8 +574,10 @@ def load_cldf_data(reader, value_column, filename, expect_multiple=False):
     return data
 
 
-def iterlocations(filename):
-    with UnicodeDictReader(filename, dialect=sniff(filename, default_dialect=None)) as reader:
+def iterlocations(filename, encoding=None, delimiter=None):
+    dialect = sniff(filename, default_dialect=None, encoding=encoding, delimiter=delimiter)
+    with _source(filename, encoding or 'utf-8-sig') as source, UnicodeDictReader(
+            source, dialect=dialect, **({'encoding': encoding} if encoding else {})) as reader:
         # Identify fieldnames
         fieldnames = [(n.lower(), n) for n in reader.fieldnames]
         fieldmap = {}
@@ -177,6 +605,24 @@ def iterlocations(filename):
             yield (row[fieldmap['language identifier']].strip(), (lat, lon))
 
 
+def load_locations(filenames, jobs=1, **kw):
+    """
+    Read several location data files, concurrently in a pool of worker processes if `jobs` > 1.
+
+    :param kw: Keyword arguments passed into `iterlocations`.
+    :return: List of `dict`s mapping language identifiers to locations, one per file.
+    """
+    read = functools.partial(_read_locations, **kw)
+    if jobs < 2 or len(filenames) < 2:
+        return [read(fname) for fname in filenames]
+    with concurrent.futures.ProcessPoolExecutor(min(jobs, len(filenames))) as pool:
+        return list(pool.map(read, filenames))
+
+
+def _read_locations(filename, **kw):
+    return dict(iterlocations(filename, **kw))
+
+
 def get_dataset(fname):
     """Load a CLDF dataset.
 
@@ -188,6 +634,10 @@ def get_dataset(fname):
     CLDF module specifications. Directories are checked for the presence of
     any CLDF datasets in undefined order of the dataset types.
 
+    Compressed files - e.g. `Wordlist-metadata.json.gz` or `forms.csv.gz` - are
+    recognized by the name without the compression suffix; tables of a dataset
+    may be compressed, too (see `_iter_table`).
+
     Parameters
     ----------
     fname : str or Path
@@ -200,13 +650,100 @@ def get_dataset(fname):
     fname = Path(fname)
     if not fname.exists():
         raise FileNotFoundError('{:} does not exist'.format(fname))
+    if is_compressed(fname):
+        name = uncompressed_name(fname)
+        if name.suffix == '.json':
+            with open_file(fname, encoding='utf8') as fp:
+                # Table URLs are resolved relative to the (uncompressed) metadata file:
+                tablegroup = TableGroup(
+                    fname=name, **TableGroup.partition_properties(json.load(fp)))
+            for mod in pycldf.dataset.get_modules():
+                if mod.match(tablegroup):
+                    return mod.cls(tablegroup)
+            return pycldf.dataset.Dataset(tablegroup)
+        try:
+            cls = next(mod.cls for mod in pycldf.dataset.get_modules() if mod.match(name))
+        except StopIteration:
+            raise ValueError('{0} does not match a CLDF module spec'.format(fname))
+        return cls.from_metadata(fname.parent)
     if fname.suffix == '.json':
         return pycldf.dataset.Dataset.from_metadata(fname)
     return pycldf.dataset.Dataset.from_data(fname)
 
 
+def _iter_table(dataset, component, columns, filters=None):
+    """
+    Iterate over the rows of a table of a CLDF dataset, reading only some of its columns.
+
+    Rows are skipped as soon as a filter rejects them, before any other cell is parsed.  Tables
+    may be stored compressed, i.e. under the URL given in the metadata plus one of the suffixes
+    `.gz`, `.xz` or `.bz2`, and are decompressed while reading.
+
+    :param columns: Names of the columns to read; `None` is read as a column of `None`s.
+    :param filters: Optional `dict` mapping column names to predicates on the cell values.
+    :return: Generator of `tuple`s of the values of `columns`.
+    """
+    table = dataset[component]
+    filters = filters or {}
+    fname = Path(str(table.url.resolve(table.base)))
+    if not fname.exists():
+        fname = next(
+            (fname.with_name(fname.name + suffix) for suffix in COMPRESSION
+             if fname.with_name(fname.name + suffix).exists()),
+            fname)
+    if not fname.exists():
+        # Zipped tables and the like are left to csvw.
+        for row in table.iterdicts():
+            if all(pred(row.get(name)) for name, pred in filters.items()):
+                yield tuple(row.get(name) for name in columns)
+        return
+
+    dialect = table.dialect or dataset.tablegroup.dialect
+    with _source(fname, dialect.encoding) as source, \
+            UnicodeReader(source, dialect=dialect) as reader:
+        reader = iter(reader)
+        if dialect.header:
+            header = next(reader, [])
+        else:
+            header = [col.header for col in table.tableSchema.columns if not col.virtual]
+        # Map column names to pairs (index in a row, column description or None for columns
+        # which are not specified in the metadata):
+        index = {}
+        for i, name in enumerate(header):
+            col = table.tableSchema.get_column(name)
+            index.setdefault(col.header if col else name, (i, col))
+
+        def reader_for(name):
+            if name is None:
+                return lambda row: None
+            if name not in index:
+                raise ValueError("{0} has no column {1}".format(fname, name))
+            i, col = index[name]
+            return lambda row: (col.read(row[i]) if col else row[i]) if i < len(row) else None
+
+        def check_for(name, pred):
+            # Filtered columns typically hold few distinct values, so the verdicts are memoized
+            # by raw cell content, saving the parsing of cells.
+            get, verdicts = reader_for(name), {}
+            i = index[name][0]
+
+            def check(row):
+                raw = row[i] if i < len(row) else None
+                if raw not in verdicts:
+                    verdicts[raw] = pred(get(row))
+                return verdicts[raw]
+            return check
+
+        checks = [check_for(name, pred) for name, pred in filters.items()]
+        getters = [reader_for(name) for name in columns]
+        for row in reader:
+            if all(check(row) for check in checks):
+                yield tuple(get(row) for get in getters)
+
+
 # TODO: Change the behaviour to always expect multiple.
-def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
+def read_cldf_dataset(filename, code_column=None, expect_multiple=False,
+                      languages=None, features=None, exclusions=None, cognatesets=None):
     """Load a CLDF dataset.
 
     Load the file as `json` CLDF metadata description file, or as metadata-free
@@ -217,10 +754,26 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
     CLDF module specifications. Directories are checked for the presence of
     any CLDF datasets in undefined order of the dataset types.
 
+    The filters are applied while streaming the FormTable or ValueTable, reading
+    only the columns needed, and CognateTable rows are only joined for forms
+    which passed the filters. Languages and features are matched by the IDs
+    BEASTling assigns to them, i.e. the keys of the returned data. A language
+    with rows in the table is included in the data - possibly without any
+    features - even if all of its rows are filtered out by feature or cognate
+    set.
+
     Parameters
     ----------
     fname : str or Path
         Path to a CLDF dataset
+    languages : container
+        Optional container of the languages to load; `None` means all languages.
+    features : container
+        Optional container of the features to load; `None` means all features.
+    exclusions : container
+        Optional container of features not to load.
+    cognatesets : container
+        Optional container of the cognate set IDs (or codes) to load.
 
     Returns
     -------
@@ -242,8 +795,35 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
     lang_ids, language_code_map = build_lang_ids(dataset, col_map)
     feature_ids = {}
     if col_map.parameters:
-        for row in dataset["ParameterTable"]:
-            feature_ids[row[col_map.parameters.id]] = sanitise_name(row[col_map.parameters.name])
+        for id_, name in _iter_table(
+                dataset, "ParameterTable", [col_map.parameters.id, col_map.parameters.name]):
+            if name is not None:
+                feature_ids[id_] = sanitise_name(name)
+
+    def lang_id(ref):
+        return lang_ids.get(ref, ref)
+
+    def feature_id(ref):
+        return feature_ids.get(ref, ref)
+
+    # Rows of languages not requested are skipped before anything else is read.
+    if dataset.module == "Wordlist":
+        language_column = col_map.forms.languageReference
+        parameter_column = col_map.forms.parameterReference
+    else:
+        language_column = col_map.values.languageReference
+        parameter_column = col_map.values.parameterReference
+    filters = {}
+    if languages is not None:
+        filters[language_column] = lambda ref: lang_id(ref) in languages
+
+    def wanted(row):
+        # Make sure the language is in the data, even if none of its features are wanted.
+        _ = data[row[0]]
+        return _wanted(row[1], features, exclusions)
+
+    def wanted_code(code):
+        return cognatesets is None or code in cognatesets
 
     # Build actual data dictionary, based on dataset type
     if dataset.module == "Wordlist":
@@ -258,76 +838,260 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
                     col_map.cognates.formReference):
                     code_column = col_map.cognates.cognatesetReference
                     form_reference = col_map.cognates.formReference
-                    if expect_multiple:
-                        cognatesets = collections.defaultdict(list)
-                        for row in dataset["CognateTable"]:
-                            cognatesets[row[form_reference]].append(row[code_column])
-                    else:
-                        cognatesets = collections.defaultdict(lambda: "?")
-                        for row in dataset["CognateTable"]:
-                            cognatesets[row[form_reference]] = row[code_column]
                 else:
                     raise ValueError(
                         "Dataset {:} has no cognatesetReference column in its "
                         "primary table or in a separate cognate table. "
                         "Is this a metadata-free wordlist and you forgot to "
                         "specify code_column explicitly?".format(filename))
-                form_column = dataset["FormTable", "id"].name
                 cognate_column_in_form_table = False
 
-        language_column = col_map.forms.languageReference
-        parameter_column = col_map.forms.parameterReference
-
         warnings.filterwarnings(
             "ignore", '.*Unspecified column "Cognate_Set"', UserWarning, "csvw\.metadata", 0)
         warnings.filterwarnings(
             "ignore", '.*Unspecified column "{:}"'.format(code_column), UserWarning, "csvw\.metadata", 0)
         # We know how to deal with a 'Cognate_Set' column, even in a metadata-free CSV file
 
-        for row in dataset["FormTable"].iterdicts():
-            lang_id = lang_ids.get(row[language_column], row[language_column])
-            feature_id = feature_ids.get(row[parameter_column], row[parameter_column])
-            if cognate_column_in_form_table:
+        rows = (
+            (lang_id(lang), feature_id(param), value) for lang, param, value in _iter_table(
+                dataset,
+                "FormTable",
+                [language_column, parameter_column,
+                 code_column if cognate_column_in_form_table else col_map.forms.id],
+                filters))
+        if cognate_column_in_form_table:
+            for lang, feature, code in filter(wanted, rows):
+                if not wanted_code(code):
+                    continue
                 if expect_multiple:
-                    data[lang_id][feature_id].append(row[code_column])
+                    data[lang][feature].append(code)
                 else:
-                    data[lang_id][feature_id] = row[code_column]
+                    data[lang][feature] = code
+            return data, language_code_map
+
+        # Join the cognate judgements for the forms which passed the filters:
+        forms = list(filter(wanted, rows))
+        form_ids = set(form for _, _, form in forms)
+        if expect_multiple:
+            cognatesets_by_form = collections.defaultdict(list)
+        else:
+            cognatesets_by_form = collections.defaultdict(lambda: "?")
+        for form, code in _iter_table(
+                dataset,
+                "CognateTable",
+                [form_reference, code_column],
+                {form_reference: form_ids.__contains__, code_column: wanted_code}):
+            if expect_multiple:
+                cognatesets_by_form[form].append(code)
             else:
-                data[lang_id][feature_id] = cognatesets[row[col_map.forms.id]]
+                cognatesets_by_form[form] = code
+        for lang, feature, form in forms:
+            data[lang][feature] = cognatesets_by_form[form]
         return data, language_code_map
 
     if dataset.module == "StructureDataset":
         code_column = col_map.values.codeReference or col_map.values.value
-        for row in dataset["ValueTable"]:
-            lang_id = lang_ids.get(
-                row[col_map.values.languageReference], row[col_map.values.languageReference])
-            feature_id = feature_ids.get(
-                row[col_map.values.parameterReference], row[col_map.values.parameterReference])
+        rows = (
+            (lang_id(lang), feature_id(param), value) for lang, param, value in _iter_table(
+                dataset, "ValueTable", [language_column, parameter_column, code_column], filters))
+        for lang, feature, value in filter(wanted, rows):
+            if not wanted_code(value):
+                continue
             if expect_multiple:
-                data[lang_id][feature_id].append(row[code_column] or '')
+                data[lang][feature].append(value or '')
             else:
-                data[lang_id][feature_id] = row[code_column] or ''
+                data[lang][feature] = value or ''
         return data, language_code_map
 
 
+# Number of rows fetched at once from a CLDF SQLite database.
+SQLITE_BATCH_SIZE = 10000
+
+
+def _fetch(db, sql, params=()):
+    cursor = db.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(SQLITE_BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _sql_columns(available, columns):
+    """
+    List columns for an SQL SELECT statement, selecting NULL for optional columns not in a table.
+    """
+    return ', '.join('`{0}`'.format(c) if c in available else 'NULL' for c in columns)
+
+
+def _sql_filter(db, column, name, ids=None, excluded=None):
+    """
+    Translate a filter on identifiers of a CLDF SQLite database into SQL.
+
+    The IDs are stored in a temporary table, so SQLite can look them up with an index.
+
+    :return: SQL condition on `column`
+    """
+    conditions = []
+    for op, values in [('IN', ids), ('NOT IN', excluded)]:
+        if values is None:
+            continue
+        table = 'beastling_{0}_{1}'.format(name, len(conditions))
+        db.execute('CREATE TEMP TABLE {0} (id TEXT PRIMARY KEY)'.format(table))
+        db.executemany(
+            'INSERT OR IGNORE INTO temp.{0} VALUES (?)'.format(table), ((v,) for v in values))
+        conditions.append('{0} {1} (SELECT id FROM temp.{2})'.format(column, op, table))
+    return ' AND '.join(conditions) or '1'
+
+
+def _refs(ids, wanted):
+    """
+    The references to rows of a CLDF table which BEASTling identifies by one of `wanted`.
+    """
+    if wanted is None:
+        return None
+    return {ref for ref, id_ in ids.items() if id_ in wanted} | \
+        {id_ for id_ in wanted if id_ not in ids}
+
+
+def read_cldf_sqlite(filename, code_column=None, expect_multiple=False,
+                     languages=None, features=None, exclusions=None, cognatesets=None):
+    """
+    Load a CLDF dataset from an SQLite database, as created by `cldf createdb`.
+
+    The filters have the same meaning as for `read_cldf_dataset`, but are applied by SQLite, so
+    only the rows of the requested languages, features and cognate sets are read.
+
+    :param code_column: Optional name of the column of the FormTable holding the codes.
+    :return: pair (data, language_code_map)
+    """
+    if not Path(filename).exists():
+        raise FileNotFoundError('{:} does not exist'.format(filename))
+    db = sqlite3.connect('file:{0}?mode=ro'.format(Path(filename).resolve().as_posix()), uri=True)
+    try:
+        tables = {
+            name: [col[1] for col in db.execute('PRAGMA table_info(`{0}`)'.format(name))]
+            for name, in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "FormTable" in tables:
+            table = "FormTable"
+        elif "ValueTable" in tables:
+            table = "ValueTable"
+        else:
+            raise ValueError(
+                "{:} is not an SQLite database of a CLDF Wordlist or StructureDataset".format(
+                    filename))
+
+        lang_ids, language_code_map = {}, {}
+        if "LanguageTable" in tables:
+            lang_ids, language_code_map = _build_lang_ids(db.execute(
+                "SELECT {0} FROM LanguageTable ORDER BY rowid".format(_sql_columns(
+                    tables["LanguageTable"], ['cldf_id', 'cldf_name', 'cldf_glottocode']))))
+        feature_ids = {}
+        if "ParameterTable" in tables:
+            feature_ids = {
+                id_: sanitise_name(name) for id_, name in
+                db.execute("SELECT {0} FROM ParameterTable".format(_sql_columns(
+                    tables["ParameterTable"], ['cldf_id', 'cldf_name'])))
+                if name is not None}
+
+        # Translate the filters on BEASTling's identifiers into filters on the references:
+        lang_filter = _sql_filter(
+            db, 't.cldf_languageReference', 'languages', _refs(lang_ids, languages))
+        feature_filter = _sql_filter(
+            db, 't.cldf_parameterReference', 'features',
+            _refs(feature_ids, features), _refs(feature_ids, exclusions))
+
+        if expect_multiple:
+            data = collections.defaultdict(lambda: collections.defaultdict(lambda: []))
+        else:
+            data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
+
+        # Languages with rows in the table are included in the data, even if none of their
+        # features are wanted.
+        for lang, _ in _fetch(db, """\
+SELECT t.cldf_languageReference, min(t.rowid) AS r FROM {0} AS t
+WHERE {1} GROUP BY t.cldf_languageReference ORDER BY r""".format(table, lang_filter)):
+            _ = data[lang_ids.get(lang, lang)]
+
+        if table == "FormTable":
+            code_column = code_column or (
+                'cldf_cognatesetReference' if 'cldf_cognatesetReference' in tables[table]
+                else None)
+        else:
+            code_column = 'cldf_codeReference' if 'cldf_codeReference' in tables[table] \
+                else 'cldf_value'
+
+        if code_column:
+            if code_column not in tables[table]:
+                raise ValueError("{0} has no column {1} in its {2}".format(
+                    filename, code_column, table))
+            code_filter = _sql_filter(db, 't.`{0}`'.format(code_column), 'codes', cognatesets)
+            for lang, param, code in _fetch(db, """\
+SELECT t.cldf_languageReference, t.cldf_parameterReference, t.`{0}` FROM {1} AS t
+WHERE {2} AND {3} AND {4} ORDER BY t.rowid""".format(
+                    code_column, table, lang_filter, feature_filter, code_filter)):
+                lang, feature = lang_ids.get(lang, lang), feature_ids.get(param, param)
+                if table == "ValueTable":
+                    code = code or ''
+                if expect_multiple:
+                    data[lang][feature].append(code)
+                else:
+                    data[lang][feature] = code
+            return data, language_code_map
+
+        if not {'cldf_formReference', 'cldf_cognatesetReference'}.issubset(
+                tables.get("CognateTable", [])):
+            raise ValueError(
+                "Dataset {:} has no cognatesetReference column in its "
+                "primary table or in a separate cognate table.".format(filename))
+        # Join the cognate judgements for the forms which passed the filters:
+        code_filter = _sql_filter(db, 'c.cldf_cognatesetReference', 'codes', cognatesets)
+        form = None
+        for form_id, lang, param, code in _fetch(db, """\
+SELECT t.cldf_id, t.cldf_languageReference, t.cldf_parameterReference, c.cldf_cognatesetReference
+FROM FormTable AS t LEFT JOIN CognateTable AS c ON c.cldf_formReference = t.cldf_id AND {0}
+WHERE {1} AND {2} ORDER BY t.rowid, c.rowid""".format(code_filter, lang_filter, feature_filter)):
+            lang, feature = lang_ids.get(lang, lang), feature_ids.get(param, param)
+            if form_id != form:
+                # Each form replaces the cognate sets of earlier forms for the same feature.
+                form = form_id
+                data[lang][feature] = [] if expect_multiple else "?"
+            if code is None:
+                continue
+            if expect_multiple:
+                data[lang][feature].append(code)
+            else:
+                data[lang][feature] = code
+        return data, language_code_map
+    finally:
+        db.close()
+
+
 def build_lang_ids(dataset, col_map):
     if col_map.languages is None:
         # No language table so we can't do anything
         return {}, {}
 
     col_map = col_map.languages
+    return _build_lang_ids(
+        _iter_table(dataset, "LanguageTable", [col_map.id, col_map.name, col_map.glottocode]))
+
+
+def _build_lang_ids(rows):
+    """
+    Assign identifiers to the languages of a CLDF dataset.
+
+    :param rows: Iterable of triples (ID, name, Glottocode) of the rows of a LanguageTable.
+    :return: pair (dict mapping IDs to identifiers, dict mapping identifiers to Glottocodes)
+    """
     lang_ids = {}
     language_code_map = {}
 
     # First check for unique names and Glottocodes
-    names = []
-    gcs = []
-    langs = []
-    for row in dataset["LanguageTable"]:
-        langs.append(row)
-        names.append(row[col_map.name])
-        if row[col_map.glottocode]:
-            gcs.append(row[col_map.glottocode])
+    langs = list(rows)
+    names = [name for _, name, _ in langs]
+    gcs = [gc for _, _, gc in langs if gc]
 
     unique_names = len(set(names)) == len(names)
     unique_gcs = len(set(gcs)) == len(gcs) == len(names)
@@ -335,16 +1099,16 @@ def build_lang_ids(dataset, col_map):
     log.info('{0} are used as language identifiers'.format(
         'Names' if unique_names else ('Glottocodes' if unique_gcs else 'dataset-local IDs')))
 
-    for row in langs:
+    for id_, name, gc in langs:
         if unique_names:
             # Use names if they're unique, for human-friendliness
-            lang_ids[row[col_map.id]] = sanitise_name(row[col_map.name])
+            lang_ids[id_] = sanitise_name(name)
         elif unique_gcs:
             # Otherwise, use glottocodes as at least they are meaningful
-            lang_ids[row[col_map.id]] = row[col_map.glottocode]
+            lang_ids[id_] = gc
         else:
             # As a last resort, use the IDs which are guaranteed to be unique
-            lang_ids[row[col_map.id]] = row[col_map.id]
-        if row[col_map.glottocode]:
-            language_code_map[lang_ids[row[col_map.id]]] = row[col_map.glottocode]
+            lang_ids[id_] = id_
+        if gc:
+            language_code_map[lang_ids[id_]] = gc
     return lang_ids, language_code_map
@@ -1,6 +1,7 @@
 import collections
 
-from ..fileio.datareaders import load_data
+from ..fileio.datareaders import load_matrix
+from ..fileio.datamatrix import MISSING
 from beastling.util.fileio import iterlines
 from beastling.util import xml
 from beastling.util import log
@@ -63,31 +64,11 @@ class BaseModel(FromOptions):
         self.metadata = []
         self.treedata = []
 
-        # Load the entire dataset from the file
-        self.data, language_code_map = load_data(
-            self.data_filename,
-            file_format=model_config.options.get("file_format", None),
-            lang_column=model_config.options.get("language_column", None),
-            value_column=model_config.options.get("value_column", None),
-            expect_multiple=True)
-
-        # Augment the Glottolog classifications with human-friendly language
-        # names which may have been read from a CLDF dataset.  Note that we
-        # store both the actual language ID and its lowercase transformation.
-        # This is kind of ugly, but we inconsistently convert things to
-        # lowercase before doing Glottolog lookups all over the place, so
-        # this is the easiest way to make this work everywhere.  We should
-        # clean this up some day!
-        for language_id, glottocode in language_code_map.items():
-            if glottocode in global_config.classifications:
-                global_config.classifications[language_id] = global_config.classifications[glottocode]
-                global_config.classifications[language_id.lower()] = global_config.classifications[language_id]
-            if glottocode in global_config.glotto_macroareas:
-                global_config.glotto_macroareas[language_id] = global_config.glotto_macroareas[glottocode]
-                global_config.glotto_macroareas[language_id.lower()] = global_config.glotto_macroareas[language_id]
-            if glottocode in global_config.locations:
-                global_config.locations[language_id] = global_config.locations[glottocode]
-                global_config.locations[language_id.lower()] = global_config.locations[language_id]
+        # Load the dataset from the file, restricted to the configured features and languages.
+        # CLDF datasets may come with a mapping of language IDs to Glottocodes, which the global
+        # config uses to augment its Glottolog data.
+        self.matrix, self.language_code_map = load_matrix(
+            self.data_filename, **self.load_options(model_config, global_config))
 
         # Remove features not wanted in this analysis
         self.build_feature_filter()
@@ -96,6 +77,35 @@ class BaseModel(FromOptions):
         # Keep this around for later...
         self.global_config = global_config
 
+    @staticmethod
+    def load_options(model_config, global_config):
+        """
+        The keyword arguments for `load_matrix` to load the data of a model.
+        """
+        # Dropping languages while reading would change the number of datapoints the
+        # minimum_data check of the global config relates to, so the language filter is only
+        # pushed down if there is no such check.
+        return dict(
+            file_format=model_config.options.get("file_format", None),
+            lang_column=model_config.options.get("language_column", None),
+            value_column=model_config.options.get("value_column", None),
+            encoding=model_config.options.get("encoding", None),
+            delimiter=model_config.options.get("delimiter", None),
+            expect_multiple=True,
+            features=None if model_config.features == ["*"] else set(model_config.features),
+            exclusions=set(model_config.exclusions),
+            languages=None if global_config.languages.minimum_data
+            else set(global_config.languages.languages) or None,
+            jobs=global_config.admin.jobs)
+
+    @property
+    def data(self):
+        """
+        Read-only view of `self.matrix`, mapping languages to mappings of features to lists of
+        values.
+        """
+        return self.matrix.view()
+
     def build_feature_filter(self):
         """
         Create the self.feature_filter attribute, which is a set of feature
@@ -103,10 +113,7 @@ class BaseModel(FromOptions):
         attribute.
         """
         if self.features == ["*"]:
-            self.features = set()
-            for lang_features in self.data.values():
-                self.features |= set(lang_features.keys())
-            self.features = list(self.features)
+            self.features = list(self.matrix.features)
         if self.exclusions:
             self.features = [f for f in self.features if f not in self.exclusions]
         self.feature_filter = set(self.features)
@@ -165,15 +172,13 @@ class BaseModel(FromOptions):
         Remove all languages from the data set which are not part of the
         configured language filter.
         """
-        all_langs = self.data.keys()
-        langs_to_remove = [l for l in all_langs if not self.config.filter_language(l)]
-        for lang in langs_to_remove:
-            self.data.pop(lang)
+        self.matrix.select(
+            languages=[l for l in self.matrix.languages if self.config.filter_language(l)])
         # Make sure we've not removed all languages
-        if not self.data.keys():
+        if not self.matrix.languages:
             raise ValueError("Language filters leave nothing in the dataset for model '%s'!" % self.name)
         # Keep a sorted list so that the order of things in XML is deterministic
-        self.languages = sorted(list(self.data.keys()))
+        self.languages = sorted(self.matrix.languages)
 
     def load_rate_partition(self):
         """
@@ -228,15 +233,9 @@ class BaseModel(FromOptions):
         Remove all features from the data set which are not part of the
         configured feature filter.
         """
-        self.features = set()
-        for language in self.data.values():
-            features_in_data = set(language.keys())
-            features_to_keep = features_in_data & self.feature_filter
-            self.features |= features_to_keep
-            features_to_remove = features_in_data - features_to_keep
-            for feat in features_to_remove:
-                language.pop(feat)
-        self.features = sorted(list(self.features))
+        # The matrix only has columns for features with data for some language.
+        self.features = sorted(f for f in self.matrix.features if f in self.feature_filter)
+        self.matrix.select(features=self.features)
 
     def reduce_multivalue_data(self, list_of_data_points):
         """Reduce a list of data points to a single one.
@@ -260,18 +259,11 @@ class BaseModel(FromOptions):
         self.missing_ratios = {}
         self.counts = {}
         self.codemaps = {}
+        self.value_codes = {}
         for f in self.features:
             # Compute various things
-            all_values = []
-            for l in self.data:
-                point = self.reduce_multivalue_data(self.data[l].get(f, ["?"]))
-                all_values.append(point)
-            missing_data_ratio = all_values.count("?") / (1.0*len(all_values))
-            non_q_values = [v for v in all_values if v != "?"]
-            counts = {}
-            for v in non_q_values:
-                counts[v] = non_q_values.count(v)
-            unique_values = list(set(non_q_values))
+            counts, missing_data_ratio = self.count_feature_values(f)
+            unique_values = list(counts)
             # Sort unique_values carefully.
             # Possibly all feature values are numeric strings, e.g. "1", "2", "3".
             # If we sort these as strings then we get weird things like "10" < "2".
@@ -285,6 +277,7 @@ class BaseModel(FromOptions):
             else:
                 unique_values.sort()
             self.unique_values[f] = unique_values
+            self.value_codes[f] = {v: i for i, v in enumerate(unique_values)}
 
             N = len(unique_values)
             self.valuecounts[f] = N
@@ -292,6 +285,26 @@ class BaseModel(FromOptions):
             self.counts[f] = counts
             self.codemaps[f] = self.build_codemap(unique_values)
 
+    def count_feature_values(self, feature):
+        """
+        Count the values of a feature, reducing multiple values per language to one.
+
+        Values are tallied once per distinct cell of the data matrix, weighted by the number of
+        languages sharing the cell, so the cost is linear in the number of languages.
+
+        :return: pair (`dict` mapping the values other than "?" to their number of occurrences, \
+        ratio of languages with missing data)
+        """
+        cell_counts, missing = self.matrix.bincount(feature)
+        counts = {}
+        if missing:
+            counts[self.reduce_multivalue_data(["?"])] = missing
+        for cell, n in zip(self.matrix.cells(feature), cell_counts):
+            if n:
+                point = self.reduce_multivalue_data(list(cell))
+                counts[point] = counts.get(point, 0) + n
+        return counts, counts.pop("?", 0) / (1.0*len(self.matrix.languages))
+
     def remove_unwanted_features(self):
         """
         Remove any undesirable features from the dataset, such as those with
@@ -334,9 +347,7 @@ class BaseModel(FromOptions):
 
         for bad in bad_feats:
             self.features.remove(bad)
-            for lang in self.languages:
-                if bad in self.data[lang]:
-                    self.data[lang].pop(bad)
+        self.matrix.select(features=self.features)
 
         # Make sure there's something left
         if not self.features:
@@ -514,7 +525,8 @@ class BaseModel(FromOptions):
         Add likelihood distribution corresponding to all features in the
         dataset.
         """
-        for n, f in enumerate(self.features):
+        self.feature_data = []
+        for n, f in enumerate(self.plated(likelihood)):
             fname = "%s:%s" % (self.name, xml.valid_id(f))
             attribs = {"id": "featureLikelihood:%s" % fname,
                        "spec": "TreeLikelihood",
@@ -543,17 +555,20 @@ class BaseModel(FromOptions):
                 # Use a different likelihood spec (also depending on whether
                 # the whole tree is reconstructed, or only some nodes)
                 if self.treewide_reconstruction:
-                    distribution.attrib["spec"] = "AncestralStateTreeLikelihood"
+                    xml.set_attribute(distribution, "spec", "AncestralStateTreeLikelihood")
                     self.treedata.append(attribs["id"])
-                    distribution.attrib["tag"] = f
+                    xml.set_attribute(distribution, "tag", f)
                 else:
-                    distribution.attrib["spec"] = "lucl.beast.statereconstruction.AncestralStatesLogger"
-                    distribution.attrib["value"] = " ".join(self.pattern_names(f))
+                    xml.set_attribute(
+                        distribution,
+                        "spec",
+                        "lucl.beast.statereconstruction.AncestralStatesLogger")
+                    xml.set_attribute(distribution, "value", " ".join(self.pattern_names(f)))
                     for label in self.reconstruct_at:
                         langs = self.config.language_group(label)
                         self.beastxml.add_taxon_set(distribution, label, langs)
                     self.metadata.append(attribs["id"])
-                distribution.attrib["useAmbiguities"] = "false"
+                xml.set_attribute(distribution, "useAmbiguities", "false")
 
             # Sitemodel
             self.add_sitemodel(distribution, f, fname)
@@ -561,6 +576,29 @@ class BaseModel(FromOptions):
             # Data
             self.add_feature_data(distribution, n, f, fname)
 
+        if self.feature_data:
+            # The alignments of the features are defined right after the alignment they filter.
+            beast = self.beastxml.beast
+            index = list(beast).index(self.master_data) + 1
+            beast[index:index] = self.feature_data
+
+    def plated(self, parent, names=None):
+        """
+        Iterate over the features of the model - or over `names`, the per-feature identifiers
+        of some parameters - grouping the elements added to `parent` for each feature into
+        plates, if `plates` is set in the admin section.
+        """
+        names = self.features if names is None else names
+        if not self.config.admin.plates or len(names) != len(self.features):
+            yield from names
+            return
+        blocks = []
+        for feature, name in zip(self.features, names):
+            start = len(parent)
+            yield name
+            blocks.append((feature, parent[start:]))
+        xml.add_plates(parent, blocks, "feature")
+
     def add_sitemodel(self, distribution, feature, fname):
         mr = self.get_mutation_rate(feature, fname)
         sitemodel = xml.siteModel(
@@ -576,13 +614,15 @@ class BaseModel(FromOptions):
 
     def add_master_data(self, beast):
         self.filters = {}
-        data = xml.data(
+        data = self.master_data = xml.data(
             beast, id="data_%s" % self.name, name="data_%s" % self.name, dataType="integer")
+        # Data points are formatted once per distinct cell of each feature, and the sequence of
+        # a language is assembled from the formatted cells of its row of the data matrix.
+        encodings, normalised = zip(*[self.encode_feature(f) for f in self.features])
+        columns = [self.matrix.columns[f] for f in self.features]
         for lang in self.languages:
-            formatted_points = [
-                self.format_datapoint(
-                    f, self.data[lang].get(f, ["?"]))
-                for f in self.features]
+            row = self.matrix.row(lang)
+            formatted_points = [encoding[row[col]] for encoding, col in zip(encodings, columns)]
             value_string = self.data_separator.join(formatted_points)
             if not self.filters:
                 n = 1
@@ -599,6 +639,27 @@ class BaseModel(FromOptions):
                     n += length
             xml.sequence(
                 data, id="language_data_%s:%s" % (self.name, lang), taxon=lang, value=value_string)
+        # format_datapoint may normalise points in place - which we keep.
+        for f, cells in zip(self.features, normalised):
+            if cells:
+                self.matrix.recode(f, lambda cell: cells.get(cell, cell))
+
+    def encode_feature(self, feature):
+        """
+        Format the data points of a feature for the alignment.
+
+        :return: pair (`dict` mapping the codes in the data matrix column of the feature - \
+        including `MISSING` - to formatted data points, `dict` mapping cells to the points \
+        `format_datapoint` normalised them to)
+        """
+        encoding, normalised = {}, {}
+        cells = self.matrix.cells(feature)
+        for code in sorted(set(self.matrix.column(feature))):
+            point = ["?"] if code == MISSING else list(cells[code])
+            encoding[code] = self.format_datapoint(feature, point)
+            if code != MISSING and tuple(point) != cells[code]:
+                normalised[cells[code]] = point
+        return encoding, normalised
 
     def format_datapoint(self, feature, point):
         point = self.reduce_multivalue_data(point)
@@ -611,7 +672,7 @@ class BaseModel(FromOptions):
         if point == "?":
             return point
         else:
-            return str(self.unique_values[feature].index(point))
+            return str(self.value_codes[feature][point])
 
     def _ascertained_format_datapoint(self, feature, point):
         extra_cols = self.valuecounts[feature]
@@ -620,19 +681,27 @@ class BaseModel(FromOptions):
             return self.data_separator.join(["?" for i in range(0, extra_cols + 1)])
         else:
             cols = list(range(0, extra_cols))
-            cols.append(self.unique_values[feature].index(point))
+            cols.append(self.value_codes[feature][point])
             return self.data_separator.join(map(str, cols))
 
     def add_feature_data(self, distribution, index, feature, fname):
         """
         Add <data> element corresponding to the indicated feature, descending
         from the indicated likelihood distribution.
+
+        With plates, the likelihoods of features with identical structure are written as one
+        template, so the filters and data types specific to a feature are defined separately,
+        in `self.feature_data`, and referenced from the likelihood.
         """
+        plates = self.config.admin.plates
         if self.pruned:
-            parent = xml.data(distribution, id="pruned_data_%s" % fname, spec="PrunedAlignment")
+            parent = xml.data(
+                None if plates else distribution,
+                id="pruned_data_%s" % fname,
+                spec="PrunedAlignment")
             name = "source"
         else:
-            parent = distribution
+            parent = None if plates else distribution
             name = "data"
         data = getattr(xml, name)(
             parent,
@@ -640,11 +709,20 @@ class BaseModel(FromOptions):
             spec="FilteredAlignment",
             data="@data_%s" % self.name,
             filter=self.filters[feature])
+        if plates:
+            alignment = data if parent is None else parent
+            self.feature_data.append(alignment)
+            xml.set_attribute(distribution, "data", "@%s" % alignment.get("id"))
         if self.ascertained:
-            data.set("ascertained", "true")
-            data.set("excludefrom", "0")
-            data.set("excludeto", str(self.valuecounts[feature]))
-        data.append(self.get_userdatatype(feature, fname))
+            xml.set_attribute(data, "ascertained", "true")
+            xml.set_attribute(data, "excludefrom", "0")
+            xml.set_attribute(data, "excludeto", str(self.valuecounts[feature]))
+        datatype = self.get_userdatatype(feature, fname)
+        if plates and datatype.get("idref"):
+            # Shared data types are referenced by attribute, keeping the alignments on one line.
+            xml.set_attribute(data, "userDataType", "@%s" % datatype.get("idref"))
+        else:
+            data.append(datatype)
         return data
 
     def get_userdatatype(self, feature, fname):
@@ -727,14 +805,11 @@ class BaseModel(FromOptions):
             xml.log(logger, idref="featureClockRateGammaShape:%s" % self.name)
 
     def add_likelihood_loggers(self, logger):
-        plate = ET.SubElement(logger, "plate", {
-            "var":"feature",
-            "range":",".join(self.features)})
-        ET.SubElement(plate, "log", {
-            "idref":"featureLikelihood:%s:$(feature)" % self.name})
+        plate = xml.plate(logger, var="feature", range=self.features)
+        xml.log(plate, idref="featureLikelihood:%s:$(feature)" % self.name)
         if self.rate_variation:
-            ET.SubElement(logger,"log",{"idref":"featureClockRatePrior.s:%s" % self.name})
-            ET.SubElement(logger,"log",{"idref":"featureClockRateGammaScalePrior.s:%s" % self.name})
+            xml.log(logger, idref="featureClockRatePrior.s:%s" % self.name)
+            xml.log(logger, idref="featureClockRateGammaScalePrior.s:%s" % self.name)
 
     def add_frequency_logs(self, logger):
         for f in self.features:
@@ -1,10 +1,69 @@
-import collections
+import array
 
 from .basemodel import BaseModel
+from beastling.fileio.datamatrix import MISSING
 from beastling.util import xml
 from beastling.util import log
 
 
+class SparseBinarisation(object):
+    """
+    Binary recoding of the cells of a feature in a data matrix, stored sparsely.
+
+    For each cell code, the indices of the values present in the cell are stored in CSR layout,
+    i.e. as `indices[indptr[code]:indptr[code + 1]]`, along with a flag signaling whether the
+    presence of the other values is unknown.  Dense strings of 0/1/? are only created when a
+    data point is looked up.
+    """
+    def __init__(self, matrix, feature, value_codes, extra_columns=()):
+        """
+        :param value_codes: `dict` mapping values to their index among the binary columns.
+        :param extra_columns: Constant columns preceding the value columns in the data points.
+        """
+        self.extra_columns = "".join(extra_columns)
+        self.width = len(value_codes)
+        unknown = matrix.value_code(feature, "?")
+        # Values of cells without languages may not be known to the model:
+        index = [value_codes.get(v) for v in matrix.names[matrix.columns[feature]]]
+        self.indptr, self.indices, self.unknown = array.array('i', [0]), array.array('i'), []
+        for code in range(len(matrix.offsets[matrix.columns[feature]]) - 1):
+            values = matrix.cell_values(feature, code)
+            self.unknown.append(unknown is not None and unknown in values)
+            self.indices.extend(sorted(
+                {index[v] for v in values if v != unknown and index[v] is not None}))
+            self.indptr.append(len(self.indices))
+
+    def present(self, code):
+        return self.indices[self.indptr[code]:self.indptr[code + 1]]
+
+    def __getitem__(self, code):
+        """
+        The data point for a cell code - or `MISSING` - as dense string.
+        """
+        absent = "?" if code == MISSING or self.unknown[code] else "0"
+        point = bytearray((self.extra_columns + absent * self.width).encode('ascii'))
+        if code != MISSING:
+            for index in self.present(code):
+                point[len(self.extra_columns) + index] = ord("1")
+        return point.decode('ascii')
+
+    def frequencies(self, cell_counts, width):
+        """
+        Count zeros and ones in data points of `width` binary columns, ignoring data points with
+        unknown values.
+
+        :param cell_counts: Number of languages per cell code.
+        :return: pair (number of zeros, number of ones)
+        """
+        zeros, ones = 0, 0
+        for code, n in enumerate(cell_counts):
+            if n and not self.unknown[code]:
+                present = self.indptr[code + 1] - self.indptr[code]
+                ones += n * present
+                zeros += n * (width - present)
+        return zeros, ones
+
+
 class BinaryModel(BaseModel):
 
     def __init__(self, model_config, global_config):
@@ -132,64 +191,31 @@ class BinaryModel(BaseModel):
                         model=self)
 
     def compute_feature_properties(self):
-        """Compute various items of metadata for all remaining features.
+        self.feature_value_partially_unknown = {}
+        BaseModel.compute_feature_properties(self)
+
+    def count_feature_values(self, feature):
+        """Count the values of a feature.
 
-        This is very similar to the `compute_feature_probability` method of
+        This is very similar to the `count_feature_values` method of
         BaseModel, but accounts for the possibility of having multiple values
         present.
 
         """
-
-        self.valuecounts = {}
-        self.extracolumns = collections.defaultdict(int)
-        self.unique_values = {}
-        self.missing_ratios = {}
-        self.counts = {}
-        self.codemaps = {}
-        self.feature_value_partially_unknown = {}
-        for f in self.features:
-            # Compute various things
-            all_values = []
-            # Track whether any “unknown” values were encountered. The
-            # difference between “unknown” and “absent” values matters: Assume
-            # we have a feature with 3 possible values, A, B and C. Then "A"
-            # would be binarized as "100", "B" as "010", "AB" as "110", "-" as
-            # "000", "A-" as "100", but "?" as "???" and "A?" as "1??".
-            for l, values in self.data.items():
-                if f in values:
-                    raw = values[f]
-                    while "-" in raw:
-                        raw.remove("-")
-                    if "?" in raw:
-                        raw = [x for x in raw if x!='?']
-                    all_values.append(raw)
-            missing_data_ratio = 1 - len(all_values) / len(self.data)
-            non_q_values = [v for vs in all_values for v in vs]
-            assert None not in non_q_values
-            counts = {}
-            for v in non_q_values:
-                counts[v] = non_q_values.count(v)
-            unique_values = list(set(non_q_values))
-            # Sort unique_values carefully.
-            # Possibly all feature values are numeric strings, e.g. "1", "2", "3".
-            # If we sort these as strings then we get weird things like "10" < "2".
-            # This can actually matter for things like ordinal models.
-            # So convert these to ints first...
-            if all([v.isdigit() for v in unique_values]):
-                unique_values = list(map(int, unique_values))
-                unique_values.sort()
-                unique_values = list(map(str, unique_values))
-            # ...otherwise, just sort normally
-            else:
-                unique_values.sort()
-            self.unique_values[f] = unique_values
-
-            N = len(unique_values)
-            self.valuecounts[f] = N
-            self.missing_ratios[f] = missing_data_ratio
-            self.counts[f] = counts
-            self.codemaps[f] = self.build_codemap(unique_values)
-
+        # Track whether any “unknown” values were encountered. The
+        # difference between “unknown” and “absent” values matters: Assume
+        # we have a feature with 3 possible values, A, B and C. Then "A"
+        # would be binarized as "100", "B" as "010", "AB" as "110", "-" as
+        # "000", "A-" as "100", but "?" as "???" and "A?" as "1??".
+        if self.matrix.value_code(feature, '-') is not None:
+            self.matrix.recode(feature, lambda cell: [x for x in cell if x != '-'])
+        cell_counts, _ = self.matrix.bincount(feature)
+        counts = {
+            v: n for v, n in zip(
+                self.matrix.names[self.matrix.columns[feature]], self.matrix.value_counts(feature))
+            if n and v != '?'}
+        assert None not in counts
+        return counts, 1 - sum(cell_counts) / len(self.matrix.languages)
 
     def pattern_names(self, feature):
         """Content of the columns corresponding to this feature in the alignment.
@@ -210,43 +236,68 @@ class BinaryModel(BaseModel):
             return BaseModel.format_datapoint(self, feature, point)
         else:
             # This is multistate data recoded into binary data.
-            if self.ascertained:
-                extra_columns = ["0", "1"]
-            else:
-                # If we are not ascertaining on non-constant data, we still
-                # need to add one "all zeros" column to account for the recoding
-                extra_columns = ["0"]
-            self.extracolumns[feature] = extra_columns
-
-            # Start with all zeros/question marks
             if "?" in point:
                 point.remove("?")
-                absent = "?"
+                unknown = True
             else:
-                absent = "0"
+                unknown = False
+            return self._format_recoded_datapoint(
+                feature, [self.value_codes[feature][p] for p in point if p != "?"], unknown)
+
+    def _format_recoded_datapoint(self, feature, indices, unknown):
+        """
+        Format a data point of multistate data recoded into binary data.
+
+        :param indices: Indices of the values present in the data point.
+        :param unknown: Whether the presence of other values is unknown.
+        """
+        extra_columns = self.recoding_extra_columns(feature)
 
-            valuestring = extra_columns + [
-                absent for i in range(0, self.valuecounts[feature])]
+        # Start with all zeros/question marks
+        valuestring = extra_columns + ["?" if unknown else "0"] * self.valuecounts[feature]
 
-            # Set the appropriate data column to 1
-            for subpoint in point:
-                if subpoint == "?":
-                    continue
-                valuestring[
-                    len(extra_columns) +
-                    self.unique_values[feature].index(subpoint)] = "1"
-            valuestring = "".join(valuestring)
-            return valuestring
+        # Set the appropriate data column to 1
+        for index in indices:
+            valuestring[len(extra_columns) + index] = "1"
+        return "".join(valuestring)
+
+    def recoding_extra_columns(self, feature):
+        if self.ascertained:
+            extra_columns = ["0", "1"]
+        else:
+            # If we are not ascertaining on non-constant data, we still
+            # need to add one "all zeros" column to account for the recoding
+            extra_columns = ["0"]
+        self.extracolumns[feature] = extra_columns
+        return extra_columns
+
+    def encode_feature(self, feature):
+        if not self.recoded:
+            return BaseModel.encode_feature(self, feature)
+        # Recoded data points are kept sparse, and only written out as the sequences of the
+        # alignment are assembled.
+        encoding = SparseBinarisation(
+            self.matrix, feature, self.value_codes[feature], self.recoding_extra_columns(feature))
+        normalised = {}
+        unknown = self.matrix.value_code(feature, "?")
+        names, cells = self.matrix.names[self.matrix.columns[feature]], self.matrix.cells(feature)
+        for code in set(self.matrix.column(feature)) - {MISSING}:
+            if encoding.unknown[code]:
+                # format_datapoint removes the first "?" from a data point.
+                values = self.matrix.cell_values(feature, code)
+                values.remove(unknown)
+                normalised[cells[code]] = [names[v] for v in values]
+        return encoding, normalised
 
     def add_feature_data(self, distribution, index, feature, fname):
         data = BaseModel.add_feature_data(self, distribution, index, feature, fname)
         if self.recoded:
-            data.set("ascertained", "true")
-            data.set("excludefrom", "0")
+            xml.set_attribute(data, "ascertained", "true")
+            xml.set_attribute(data, "excludefrom", "0")
             if self.ascertained:
-                data.set("excludeto", "2")
+                xml.set_attribute(data, "excludeto", "2")
             else:
-                data.set("excludeto", "1")
+                xml.set_attribute(data, "excludeto", "1")
 
     def add_operators(self, run):
         BaseModel.add_operators(self, run)
@@ -296,31 +347,27 @@ class BinaryModelWithShareParams(BinaryModel):
         else:
             features = [feature]
 
-        all_data = []
-        if self.binarised:
-            for f in features:
-                for lang in self.data:
-                    for value in self.data[lang][f]:
-                        if value == "?":
-                            continue
-                        dpoint, index = value, self.unique_values[f].index(value)
-                        all_data.append(index)
-        else:
-            for f in features:
-                for lang in self.data:
-                    all_data_points = set(self.data[lang].get(f, ["?"]))
-                    if "?" in all_data_points:
-                        valuestring = "".join(["?" for i in range(0,len(self.unique_values[f])+1)])
-                    else:
-                        valuestring = ["0" for i in range(0,len(self.unique_values[f])+1)]
-                    for value in all_data_points - {"?"}:
-                        valuestring[self.unique_values[f].index(value)+1] = "1"
-                    all_data.extend(valuestring)
-
-        all_data = [d for d in all_data if d !="?"]
-        all_data = [int(d) for d in all_data]
-        zerf = 1.0*all_data.count(0) / len(all_data)
-        onef = 1.0*all_data.count(1) / len(all_data)
+        # Zeros and ones are counted once per distinct cell, weighted by the number of languages
+        # sharing the cell.
+        zeros, ones = 0, 0
+        for f in features:
+            if self.binarised:
+                col = self.matrix.columns[f]
+                for v, n in zip(self.matrix.names[col], self.matrix.value_counts(f)):
+                    if v == "?" or not n:
+                        continue
+                    if self.value_codes[f][v] == 0:
+                        zeros += n
+                    elif self.value_codes[f][v] == 1:
+                        ones += n
+            else:
+                # Data points with unknown values are all question marks.
+                z, o = SparseBinarisation(self.matrix, f, self.value_codes[f]).frequencies(
+                    self.matrix.bincount(f)[0], len(self.unique_values[f]) + 1)
+                zeros, ones = zeros + z, ones + o
+
+        zerf = 1.0*zeros / (zeros + ones)
+        onef = 1.0*ones / (zeros + ones)
         assert abs(1.0 - (zerf+onef)) < 1e-6
         return "%.2f %.2f" % (zerf, onef)
 
@@ -351,17 +398,18 @@ class BinaryModelWithShareParams(BinaryModel):
             # Use a different likelihood spec (also depending on whether
             # the whole tree is reconstructed, or only some nodes)
             if self.treewide_reconstruction:
-                distribution.attrib["spec"] = "ancestralstatetreelikelihood"
+                xml.set_attribute(distribution, "spec", "ancestralstatetreelikelihood")
                 self.treedata.append(attribs["id"])
-                distribution.attrib["tag"] = f
+                xml.set_attribute(distribution, "tag", f)
             else:
-                distribution.attrib["spec"] = "lucl.beast.statereconstruction.ancestralstateslogger"
-                distribution.attrib["value"] = " ".join(self.pattern_names(f))
+                xml.set_attribute(
+                    distribution, "spec", "lucl.beast.statereconstruction.ancestralstateslogger")
+                xml.set_attribute(distribution, "value", " ".join(self.pattern_names(f)))
                 for label in self.reconstruct_at:
                     langs = self.config.language_group(label)
                     self.beastxml.add_taxon_set(distribution, label, langs)
                 self.metadata.append(attribs["id"])
-            distribution.attrib["useAmbiguities"] = "false"
+            xml.set_attribute(distribution, "useAmbiguities", "false")
         else:
             raise NotImplementedError(
                 "The model {:} is a binarised model with a single site "
@@ -376,12 +424,12 @@ class BinaryModelWithShareParams(BinaryModel):
             data="@data_%s" % self.name,
             filter="-")
         if self.recoded:
-            data.set("ascertained", "true")
-            data.set("excludefrom", "0")
+            xml.set_attribute(data, "ascertained", "true")
+            xml.set_attribute(data, "excludefrom", "0")
             if self.ascertained:
-                data.set("excludeto", "2")
+                xml.set_attribute(data, "excludeto", "2")
             else:
-                data.set("excludeto", "1")
+                xml.set_attribute(data, "excludeto", "1")
         data.append(self.get_userdatatype(None, None))
 
     def add_likelihood_loggers(self, logger):
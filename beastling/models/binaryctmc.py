@@ -17,7 +17,7 @@ class BinaryCTMCModel(BinaryModel):
         # If we're sharing one substmodel across all features and have already
         # created it, just reference it and that's it
         if self.subst_model_id:
-            sitemodel.set("substModel", "@%s" % self.subst_model_id)
+            xml.set_attribute(sitemodel, "substModel", "@%s" % self.subst_model_id)
             return
 
         # Otherwise, create a substmodel
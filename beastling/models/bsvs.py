@@ -16,7 +16,7 @@ class BSVSModel(BaseModel):
     def add_state(self, state):
 
         BaseModel.add_state(self, state)
-        for f in self.features:
+        for f in self.plated(state):
             fname = "%s:%s" % (self.name, f)
 
             N = self.valuecounts[f]
@@ -41,8 +41,9 @@ class BSVSModel(BaseModel):
     def add_prior(self, prior):
 
         BaseModel.add_prior(self, prior)
-        for n, f in enumerate(self.features):
+        for n, f in enumerate(self.plated(prior)):
             fname = "%s:%s" % (self.name, f)
+            n = self.feature_index(n)
 
             # Boolean Rate on/off
             sub_prior = xml.prior(prior, id="nonZeroRatePrior.s:%s" % fname, name="distribution")
@@ -120,6 +121,15 @@ class BSVSModel(BaseModel):
                 name="beta",
                 upper="0.0")
 
+    def feature_index(self, n):
+        """
+        The index of a feature as used in the IDs of its priors.
+
+        Since the IDs contain the feature name, too, the index is left out - i.e. is always 0 -
+        with plates, which can only group features with identical IDs up to their names.
+        """
+        return 0 if self.config.admin.plates else n
+
     def add_substmodel(self, sitemodel, feature, fname):
         attribs = {
             "id": "svs.s:%s"%fname,
@@ -168,8 +178,9 @@ class BSVSModel(BaseModel):
 
     def add_operators(self, run):
         BaseModel.add_operators(self, run)
-        for n, f in enumerate(self.features):
+        for n, f in enumerate(self.plated(run)):
             fname = "%s:%s" % (self.name, f)
+            n = self.feature_index(n)
             xml.operator(
                 run,
                 id="onGeorateScaler.s:%s" % fname,
@@ -11,7 +11,7 @@ class CovarionModel(BinaryModel):
     def add_state(self, state):
         BinaryModel.add_state(self, state)
         # Each feature gets a param
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(state, self.parameter_identifiers()):
             xml.parameter(
                 state,
                 text="0.5",
@@ -38,7 +38,7 @@ class CovarionModel(BinaryModel):
         # If we're sharing one substmodel across all features and have already
         # created it, just reference it and that's it
         if self.share_params and self.subst_model_id:
-            sitemodel.set("substModel", "@%s" % self.subst_model_id)
+            xml.set_attribute(sitemodel, "substModel", "@%s" % self.subst_model_id)
             return
 
         # Otherwise, create a substmodel
@@ -56,14 +56,15 @@ class CovarionModel(BinaryModel):
         # Numerical instability is an issue with this model, so we give the
         # option of using a more robust method of computing eigenvectors.
         if self.use_robust_eigensystem:
-            substmodel.set("eigenSystem", "beast.evolution.substitutionmodel.RobustEigenSystem")
+            xml.set_attribute(
+                substmodel, "eigenSystem", "beast.evolution.substitutionmodel.RobustEigenSystem")
 
         # The "vfrequencies" parameter here is the frequencies
         # of the *visible* states (present/absent) and should
         # be based on the data (if we are doing an empirical
         # analysis)
         if self.frequencies == "estimate":
-            substmodel.set("vfrequencies","@freqs_param.s:%s" % name)
+            xml.set_attribute(substmodel, "vfrequencies", "@freqs_param.s:%s" % name)
         else:
             vfreq = xml.vfrequencies(
                 substmodel,
@@ -104,7 +105,7 @@ class CovarionModel(BinaryModel):
 
     def add_prior(self, prior):
         BinaryModel.add_prior(self, prior)
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(prior, self.parameter_identifiers()):
             self._add_prior(prior, fname)
 
     def _add_prior(self, prior, name):
@@ -138,7 +139,7 @@ class CovarionModel(BinaryModel):
 
     def add_operators(self, run):
         BinaryModel.add_operators(self, run)
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(run, self.parameter_identifiers()):
             self._add_operators(run, fname)
 
     def _add_operators(self, run, name):
@@ -105,7 +105,8 @@ class GeoModel(FromOptions):
                 else:
                     xml.taxon(geoprior, idref=list(langs)[0])
                     # Drop back to F, not F2, so singletons can be sampled
-                    distribution.set("spec", "sphericalGeo.ApproxMultivariateTraitLikelihoodF")
+                    xml.set_attribute(
+                        distribution, "spec", "sphericalGeo.ApproxMultivariateTraitLikelihoodF")
                 # Also add the KML file if we have an actual constraint
                 if clade in self.geo_priors:
                     xml.region(
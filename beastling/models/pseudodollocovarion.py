@@ -12,7 +12,7 @@ class PseudoDolloCovarionModel(BinaryModel):
     def add_state(self, state):
         BinaryModel.add_state(self, state)
 
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(state, self.parameter_identifiers()):
             # One param for all features
             xml.parameter(
                 state,
@@ -39,7 +39,7 @@ class PseudoDolloCovarionModel(BinaryModel):
                 upper="1.0")
 
     def add_frequency_state(self, state):
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(state, self.parameter_identifiers()):
             xml.parameter(
                 state,
                 text="0.94 0.05 0.01",
@@ -76,7 +76,7 @@ class PseudoDolloCovarionModel(BinaryModel):
         # If we're sharing one substmodel across all features and have already
         # created it, just reference it and that's it
         if self.share_params and self.subst_model_id:
-            sitemodel.set("substModel", "@%s" % self.subst_model_id)
+            xml.set_attribute(sitemodel, "substModel", "@%s" % self.subst_model_id)
             return
 
         # Otherwise, create a substmodel
@@ -104,14 +104,15 @@ class PseudoDolloCovarionModel(BinaryModel):
             raise ValueError(
                 "Currently, Beast's pseudo-Dollo covarion model does not "
                 "support robust eigensystems.")
-            substmodel.set("eigenSystem", "beast.evolution.substitutionmodel.RobustEigenSystem")
+            xml.set_attribute(
+                substmodel, "eigenSystem", "beast.evolution.substitutionmodel.RobustEigenSystem")
 
         # The "vfrequencies" parameter here is the frequencies
         # of the *visible* states (present/absent) and should
         # be based on the data (if we are doing an empirical
         # analysis)
         if self.frequencies == "estimate":
-            substmodel.set("vfrequencies","@%s:visiblefrequencies.s" % name)
+            xml.set_attribute(substmodel, "vfrequencies", "@%s:visiblefrequencies.s" % name)
         else:
             vfreq = xml.vfrequencies(
                 substmodel,
@@ -139,7 +140,7 @@ class PseudoDolloCovarionModel(BinaryModel):
 
     def add_prior(self, prior):
         BinaryModel.add_prior(self, prior)
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(prior, self.parameter_identifiers()):
             self._add_prior(prior, fname)
 
     def _add_prior(self, prior, name):
@@ -186,7 +187,7 @@ class PseudoDolloCovarionModel(BinaryModel):
 
     def add_operators(self, run):
         BinaryModel.add_operators(self, run)
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(run, self.parameter_identifiers()):
             self._add_operators(run, fname)
 
     def _add_operators(self, run, name):
@@ -213,7 +214,7 @@ class PseudoDolloCovarionModel(BinaryModel):
             weight="0.1")
 
     def add_frequency_operators(self, run):
-        for fname in self.parameter_identifiers():
+        for fname in self.plated(run, self.parameter_identifiers()):
             xml.operator(
                 run,
                 id="%s:pdcovarion_frequency_sampler.s" % fname,
@@ -24,10 +24,7 @@ class BeastlingReport(object):
         self.macroarea_tally = collections.Counter()
         for l in self.config.languages.languages:
             if l in self.config.classifications:
-                self.family_tally.update([
-                   self.config.classifications[l][0][0]
-                   if self.config.classifications[l] else "Unclassified"
-                ])
+                self.family_tally.update([self.config.classifications.family(l)])
             if l in self.config.glotto_macroareas:
                 self.macroarea_tally.update([self.config.glotto_macroareas.get(l, "Unknown")])
         self.n_families = len(self.family_tally)
@@ -90,11 +87,17 @@ class BeastlingGeoJSON(object):
         self.geojson = {}
         self.geojson["type"] = "FeatureCollection"
         features = []
+        classifications = self.config.classifications
+
+        def classifier(lang, level):
+            ancestor = classifications.ancestor(lang, level) if lang in classifications else None
+            return ancestor[0] if ancestor else "Unclassified"
+
         classifier_level = 0
         while True:
-            all_classifiers = set([self.config.classifications[l][classifier_level][0] for l in
-            self.config.languages.languages if self.config.classifications[l]])
-            if len(all_classifiers) > 1:
+            all_classifiers = set([classifier(l, classifier_level) for l in
+            self.config.languages.languages if l in classifications])
+            if len(all_classifiers) > 1 or all_classifiers <= {"Unclassified"}:
                 break
             classifier_level += 1
         style_map = dict(zip(all_classifiers, itertools.cycle(itertools.product(_SHAPES,_COLOURS))))
@@ -102,8 +105,7 @@ class BeastlingGeoJSON(object):
         for l in self.config.languages.languages:
             if l not in self.config.locations:
                 continue
-            fam = self.config.classifications[l][0][0] if self.config.classifications[l] else "Unclassified"
-            classifier = self.config.classifications[l][classifier_level][0] if self.config.classifications[l] else "Unclassified"
+            fam, subfamily = classifier(l, 0), classifier(l, classifier_level)
             area = self.config.glotto_macroareas.get(l, "Unknown")
             lbit = {"type": "Feature"}
             (lat, lon) = self.config.locations[l]
@@ -112,8 +114,8 @@ class BeastlingGeoJSON(object):
             lbit["geometry"] = {"type":"Point", "coordinates": (lon, lat)}
             props = {"name":l, "family": fam, "macroarea": area, "location": pretty_location}
             if classifier_level > 0:
-                props["subfamily"] = classifier
-            shape, colour = style_map[classifier]
+                props["subfamily"] = subfamily
+            shape, colour = style_map[subfamily]
             props["marker-symbol"]  = shape
             props["marker-color"]  = colour
             lbit["properties"] = props
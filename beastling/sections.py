@@ -13,6 +13,7 @@ from beastling.clocks import *  # Make sure all clocks are imported.
 from beastling.clocks.baseclock import BaseClock
 from beastling.models import *  # Make sure all models are imported.
 from beastling.models.basemodel import BaseModel
+from beastling.fileio.datareaders import shard_files
 
 __all__ = ['Admin', 'MCMC', 'Languages']
 
@@ -205,12 +206,29 @@ class Admin(Section):
         "4.0",
         "A string representing a Glottolog release number.",
         getter=ConfigParser.get)
+    jobs = opt(
+        1,
+        "An integer, the number of worker processes used to load the data files of models (and "
+        "location data files) concurrently.  Defaults to 1, i.e. files are loaded one after "
+        "another.",
+        getter=ConfigParser.getint)
+    plates = opt(
+        False,
+        "A boolean value, controlling whether or not the per-feature parts of models - "
+        "likelihoods, site models and parameters - are grouped into BEAST plates, writing the "
+        "parts of features with identical structure only once.",
+        getter=ConfigParser.getboolean)
 
     def __attrs_post_init__(self):
         if self.log_all:
             self.log_trees = self.log_params = self.log_probabilities = self.log_fine_probs = True
         if self.log_fine_probs:
             self.log_probabilities = True
+        # The number of jobs may be overridden on the command line:
+        if self.cli_params.get('jobs'):
+            self.jobs = self.cli_params['jobs']
+        if self.jobs < 1:
+            raise ValueError("The number of jobs must be a positive integer.")
 
     @property
     def basename(self):
@@ -386,6 +404,9 @@ class Geography(Section):
     log_locations = opt(True, getter=ConfigParser.getboolean)
     sampling_points = opt(attr.Factory(list), getter=get_file_or_list)
     data = opt(attr.Factory(list), getter=get_list_of_files)
+    encoding = opt(None, "Encoding of the location data files.")
+    delimiter = opt(
+        None, "Delimiter of the location data files, e.g. ',' or 'tab'. Disables sniffing.")
     priors = opt(attr.Factory(dict))
     clock = opt(None)
 
@@ -426,7 +447,8 @@ class Clock(Section):
 
 
 def valid_path(instance, attribute, value):
-    if not value.exists():
+    # Data may also be read from a glob pattern matching some files.
+    if not (value.exists() or shard_files(value)):
         raise ValueError('Path {0} does not exist'.format(value))
 
 
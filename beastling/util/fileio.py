@@ -1,5 +1,13 @@
+import io
+import bz2
+import gzip
+import lzma
+import hashlib
 import pathlib
 
+# Functions to open compressed files, by file name suffix.
+COMPRESSION = {'.gz': gzip.open, '.xz': lzma.open, '.bz2': bz2.open}
+
 
 def iterlines(fname, name='file'):
     fname = pathlib.Path(fname)
@@ -8,3 +16,41 @@ def iterlines(fname, name='file'):
     with fname.open(encoding='utf8') as fp:
         for line in fp:
             yield line
+
+
+def file_hash(path):
+    """
+    Compute the SHA-1 hex digest of a file's content.
+    """
+    sha = hashlib.sha1()
+    with pathlib.Path(path).open('rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_compressed(path):
+    return pathlib.Path(path).suffix.lower() in COMPRESSION
+
+
+def uncompressed_name(path):
+    """
+    The path of a file without the suffix indicating compression, if any.
+    """
+    path = pathlib.Path(path)
+    return path.with_suffix('') if is_compressed(path) else path
+
+
+def open_file(path, mode='rt', **kw):
+    """
+    Open a - possibly compressed - file, decompressing or compressing it while streaming.
+
+    :param mode: Mode in which to open the file, as for `open`.
+    :param kw: Additional keyword arguments for text mode, e.g. `encoding` or `newline`.
+    """
+    path = pathlib.Path(path)
+    if 'b' not in mode and 't' not in mode:
+        mode += 't'
+    if is_compressed(path):
+        return COMPRESSION[path.suffix.lower()](str(path), mode, **kw)
+    return io.open(str(path), mode, **kw)
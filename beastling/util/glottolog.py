@@ -0,0 +1,497 @@
+"""
+Compiled on-disk snapshots of the Glottolog data used by BEASTling.
+
+Parsing the Glottolog newick tree and geo CSV is the largest fixed cost of
+processing a configuration which needs Glottolog.  The parsed data only
+depends on the Glottolog release files (and on the BEASTling code which parses
+them), so we store it once per release as a pickle in the user data directory
+and load that on subsequent runs.
+
+The Glottolog newick file has one top-level family per line.  The snapshot
+keeps the classification data of each family in a separately pickled blob,
+together with an index recording which family each glottocode, ISO code and
+node name belongs to, so that an analysis only needs to load the families its
+languages and clades actually live in.
+"""
+import os
+import sys
+import math
+import array
+import pickle
+import collections.abc
+from pathlib import Path
+
+import newick
+from appdirs import user_data_dir
+from csvw.dsv import reader
+
+from beastling import __version__
+from beastling.util import log
+from beastling.util.fileio import file_hash
+from beastling.util import monophyly
+
+__all__ = ['Classifications', 'GeoTable', 'load_snapshot']
+
+# Bump this whenever the layout of the pickled data changes.
+SNAPSHOT_FORMAT = 5
+
+
+def snapshot_path(release):
+    return Path(user_data_dir('beastling')) / 'glottolog-{0}.pickle'.format(release)
+
+
+class Classifications(collections.abc.Mapping):
+    """
+    Compact store of Glottolog classifications.
+
+    Glottolog nodes are numbered, and the tree is stored as arrays of parent
+    node numbers and depths, with one interned name and glottocode per node.
+    Identifiers (glottocodes, ISO codes and aliases) map to node numbers.
+
+    For backwards compatibility, the store is also a read-only mapping of
+    identifiers to classifications, i.e. lists of (name, glottocode) pairs of
+    the ancestors of a node from the top of its family down - or of the node
+    itself if it is the top of a family.
+    """
+    def __init__(self):
+        self.names = []
+        self.glottocodes = []
+        self.parents = array.array('l')
+        self.depths = array.array('l')
+        self.nodes = {}
+
+    def add_family(self, family):
+        """
+        Add the nodes of a family as stored in a snapshot.
+        """
+        offset = len(self.names)
+        self.names.extend(sys.intern(name) for name in family['names'])
+        self.glottocodes.extend(family['glottocodes'])
+        # Nodes are stored in pre-order, so parents always come before their children.
+        for parent in family['parents']:
+            if parent < 0:
+                self.parents.append(-1)
+                self.depths.append(0)
+            else:
+                self.parents.append(parent + offset)
+                self.depths.append(self.depths[parent + offset] + 1)
+        for identifier, node in family['nodes'].items():
+            self.nodes[identifier] = node + offset
+
+    def add_alias(self, identifier, other):
+        """
+        Make `identifier` refer to the same Glottolog node as `other`.
+        """
+        self.nodes[identifier] = self.nodes[other]
+
+    def node(self, identifier):
+        return self.nodes[identifier]
+
+    def lineage(self, identifier):
+        """
+        The node numbers of the classification of a language, top-down.
+        """
+        node = self.nodes[identifier]
+        if self.parents[node] < 0:
+            # Node is root of some family
+            return [node]
+        res = []
+        node = self.parents[node]
+        while node >= 0:
+            res.append(node)
+            node = self.parents[node]
+        return res[::-1]
+
+    def depth(self, identifier):
+        """
+        The length of the classification of a language.
+        """
+        return max(self.depths[self.nodes[identifier]], 1)
+
+    def family(self, identifier):
+        """
+        The name of the family of a language.
+        """
+        node = self.nodes[identifier]
+        while self.parents[node] >= 0:
+            node = self.parents[node]
+        return self.names[node]
+
+    def ancestor(self, identifier, depth):
+        """
+        The (name, glottocode) pair at position `depth` of a classification, or None.
+        """
+        node = self.nodes[identifier]
+        if self.parents[node] < 0:
+            # Node is root of some family
+            if depth > 0:
+                return None
+        elif depth < self.depths[node]:
+            while self.depths[node] > depth:
+                node = self.parents[node]
+        else:
+            return None
+        return self.names[node], self.glottocodes[node]
+
+    def in_clades(self, identifier, clades, lowercase=False):
+        """
+        Check whether any node in the classification of a language is one of `clades`.
+
+        :param clades: Container of glottocodes or node names.
+        :param lowercase: Flag signaling whether to compare lowercase node names.
+        """
+        if identifier not in self.nodes:
+            return False
+        for node in self.lineage(identifier):
+            name = self.names[node].lower() if lowercase else self.names[node]
+            if name in clades or self.glottocodes[node] in clades:
+                return True
+        return False
+
+    def descendants(self, clades):
+        """
+        Determine all nodes for which `in_clades(node, clades)` holds.
+
+        Nodes are stored in pre-order, so this can be computed in one top-down pass over the
+        tree, rather than by walking up the classification of each node.
+
+        :param clades: Container of glottocodes or node names.
+        :return: `set` of node numbers.
+        """
+        res, below = set(), bytearray(len(self.parents))
+        for node, parent in enumerate(self.parents):
+            matches = self.names[node] in clades or self.glottocodes[node] in clades
+            if parent < 0:
+                # Family roots are classified as themselves.
+                below[node] = matches
+            else:
+                below[node] = below[parent] or matches
+                matches = below[parent]
+            if matches:
+                res.add(node)
+        return res
+
+    def clade_index(self, identifiers):
+        """
+        Build an inverted index of the clades of a set of languages.
+
+        :param identifiers: Iterable of language identifiers.
+        :return: `dict` mapping lowercase node names and glottocodes of the nodes in the \
+        classifications of the languages to the `set` of languages classified under the node.
+        """
+        res = collections.defaultdict(set)
+        for identifier in identifiers:
+            if identifier.lower() not in self.nodes:
+                continue
+            for node in self.lineage(identifier.lower()):
+                res[self.names[node].lower()].add(identifier)
+                res[self.glottocodes[node]].add(identifier)
+        return dict(res)
+
+    def __getitem__(self, identifier):
+        return [(self.names[node], self.glottocodes[node]) for node in self.lineage(identifier)]
+
+    def __contains__(self, identifier):
+        return identifier in self.nodes
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class GeoTable(object):
+    """
+    Columnar store of the Glottolog geo CSV.
+
+    Each column is stored as one list or typed array, with levels and macroareas coded as small
+    integers, and missing coordinates as NaN.  Glottocodes and ISO codes map to row numbers.
+    """
+    def __init__(self):
+        self.glottocodes = []
+        self.isocodes = []
+        self.level_names = []
+        self.levels = array.array('b')
+        self.macroarea_names = []
+        self.macroareas = array.array('b')
+        self.latitudes = array.array('d')
+        self.longitudes = array.array('d')
+        self.rows = {}
+
+    @staticmethod
+    def _code(names, value):
+        if not value:
+            return -1
+        if value not in names:
+            names.append(value)
+        return names.index(value)
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Parse a Glottolog geo CSV file.
+        """
+        table = cls()
+        rows = reader(path)
+        header = next(rows)
+        glottocode, isocodes, level, macroarea, latitude, longitude = [
+            header.index(col) for col in
+            ['glottocode', 'isocodes', 'level', 'macroarea', 'latitude', 'longitude']]
+        for row in rows:
+            table.add_row(
+                row[glottocode],
+                row[isocodes].split(),
+                row[level],
+                row[macroarea],
+                float(row[latitude]) if row[latitude] and row[longitude] else math.nan,
+                float(row[longitude]) if row[latitude] and row[longitude] else math.nan)
+        return table
+
+    def add_row(self, glottocode, isocodes, level, macroarea, latitude, longitude):
+        row = len(self.glottocodes)
+        self.glottocodes.append(glottocode)
+        self.isocodes.append(tuple(isocodes))
+        self.levels.append(self._code(self.level_names, level))
+        self.macroareas.append(self._code(self.macroarea_names, macroarea))
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        for identifier in [glottocode] + list(isocodes):
+            self.rows[identifier] = row
+
+    def level(self, row):
+        return self.level_names[self.levels[row]] if self.levels[row] >= 0 else None
+
+    def macroarea(self, row):
+        return self.macroarea_names[self.macroareas[row]] if self.macroareas[row] >= 0 else None
+
+    def location(self, row):
+        if not math.isnan(self.latitudes[row]):
+            return self.latitudes[row], self.longitudes[row]
+
+    def view(self, column):
+        """
+        A mutable mapping of identifiers to the values of a column.
+
+        :param column: One of 'macroareas' or 'locations'.
+        """
+        return GeoView(self, dict(macroareas=self.macroarea, locations=self.location)[column])
+
+
+class GeoView(collections.abc.MutableMapping):
+    """
+    Mapping of identifiers to the values of a column of a `GeoTable`.
+
+    Assignments are stored in an overlay, leaving the table untouched.
+    """
+    _deleted = object()
+
+    def __init__(self, table, value):
+        self.table = table
+        self.value = value
+        self.overlay = {}
+
+    def __getitem__(self, identifier):
+        if identifier in self.overlay:
+            value = self.overlay[identifier]
+        else:
+            row = self.table.rows.get(identifier)
+            value = None if row is None else self.value(row)
+        if value is None or value is self._deleted:
+            raise KeyError(identifier)
+        return value
+
+    def __setitem__(self, identifier, value):
+        self.overlay[identifier] = value
+
+    def __delitem__(self, identifier):
+        self[identifier]
+        self.overlay[identifier] = self._deleted
+
+    def __iter__(self):
+        for identifier, row in self.table.rows.items():
+            if identifier not in self.overlay and self.value(row) is not None:
+                yield identifier
+        for identifier, value in self.overlay.items():
+            if value is not self._deleted:
+                yield identifier
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def build_family(line):
+    """
+    Parse the newick representation of one Glottolog family.
+
+    :return: `dict` with keys 'names', 'glottocodes', 'parents' and 'nodes', suitable for \
+    `Classifications.add_family`.
+    """
+    family = dict(names=[], glottocodes=[], parents=array.array('l'), nodes={})
+    numbers = {}
+    for tree in newick.loads(line):
+        for node in tree.walk():
+            label = monophyly.parse_label(node.name)
+            numbers[id(node)] = len(family['names'])
+            family['names'].append(label['name'])
+            family['glottocodes'].append(label['glottocode'])
+            family['parents'].append(numbers[id(node.ancestor)] if node.ancestor else -1)
+            family['nodes'][label['glottocode']] = numbers[id(node)]
+            if label['isocode']:
+                family['nodes'][label['isocode']] = numbers[id(node)]
+    return family
+
+
+def build_snapshot(newick, geo):
+    """
+    Parse the Glottolog newick and geo files.
+
+    :param newick: Path of the Glottolog newick file.
+    :param geo: Path of the Glottolog geo CSV file.
+    :return: pair (index, list of per-family data). The index is a `dict` with keys 'codes' \
+    (mapping glottocodes and ISO codes to family numbers), 'names' (mapping lowercase node names \
+    to sets of family numbers) and 'geo' (a `GeoTable`, including the data inherited by \
+    dialects).
+    """
+    families, codes, names = [], {}, {}
+    with Path(newick).open(encoding='utf8') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            family = build_family(line)
+            for code in family['nodes']:
+                codes[code] = len(families)
+            for name in family['names']:
+                names.setdefault(name.lower(), set()).add(len(families))
+            families.append(family)
+
+    geo = GeoTable.from_csv(geo)
+    for family in families:
+        inherit_geography(family, geo)
+
+    index = dict(codes=codes, names=names, geo=geo)
+    return index, families
+
+
+def inherit_geography(family, geo):
+    """
+    Let the dialects of a family inherit geographic data from their ancestors.
+
+    Dialects take the location of their nearest located ancestor, and - if they have none of
+    their own - the macroarea of their nearest ancestor with a macroarea.  Since nodes are
+    stored in pre-order, this is computed in a single top-down pass, carrying the nearest
+    location and macroarea down the tree.
+    """
+    located, areas = [], []
+    for glottocode, parent in zip(family['glottocodes'], family['parents']):
+        row = geo.rows.get(glottocode)
+        latlon, area = (None, -1) if row is None else (geo.location(row), geo.macroareas[row])
+        inherited_latlon = located[parent] if parent >= 0 else None
+        inherited_area = areas[parent] if parent >= 0 else -1
+        if row is not None and geo.level(row) == 'dialect':
+            latlon = inherited_latlon or latlon
+            area = area if area >= 0 else inherited_area
+            if latlon:
+                geo.latitudes[row], geo.longitudes[row] = latlon
+            geo.macroareas[row] = area
+        located.append(latlon or inherited_latlon)
+        areas.append(area if area >= 0 else inherited_area)
+
+
+def select_families(index, identifiers):
+    """
+    Determine the families containing any of the given Glottolog identifiers.
+
+    :param identifiers: Iterable of glottocodes, ISO codes or Glottolog node names.
+    :return: `set` of family numbers.
+    """
+    res = set()
+    for identifier in identifiers:
+        identifier = identifier.strip().lower()
+        if identifier in index['codes']:
+            res.add(index['codes'][identifier])
+        res |= index['names'].get(identifier, set())
+    return res
+
+
+def write_snapshot(path, key, index, families):
+    blobs = [pickle.dumps(family, protocol=pickle.HIGHEST_PROTOCOL) for family in families]
+    # Offsets are relative to the end of the pickled index.
+    offsets, offset = [], 0
+    for blob in blobs:
+        offsets.append(offset)
+        offset += len(blob)
+    index = dict(index, offsets=offsets)
+
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True)
+    tmp = path.with_name('{0}.{1}.tmp'.format(path.name, os.getpid()))
+    with tmp.open('wb') as fp:
+        pickle.dump(key, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(index, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        for blob in blobs:
+            fp.write(blob)
+    tmp.replace(path)
+
+
+def read_snapshot(path, key, identifiers):
+    with path.open('rb') as fp:
+        # The key is pickled separately, so stale snapshots can be detected without
+        # unpickling the data.
+        if pickle.load(fp) != key:
+            return None
+        index = pickle.load(fp)
+        base = fp.tell()
+        if identifiers is None:
+            wanted = range(len(index['offsets']))
+        else:
+            wanted = sorted(select_families(index, identifiers))
+        families = []
+        for i in wanted:
+            fp.seek(base + index['offsets'][i])
+            families.append(pickle.load(fp))
+    return index, families
+
+
+def load_snapshot(newick, geo, release, identifiers=None):
+    """
+    Load the parsed Glottolog data for a release, compiling it first if necessary.
+
+    A snapshot is only valid for the exact newick and geo files (identified by content hash),
+    the BEASTling version and the snapshot format which created it.  Otherwise it is rebuilt and
+    written to the user data directory.  Failure to write the snapshot is not an error.
+
+    :param identifiers: Optional iterable of glottocodes, ISO codes or Glottolog node names. If \
+    given, classifications are only loaded for the families containing these.
+    :return: `dict` with keys 'classifications' (a `Classifications` store of the selected \
+    families), 'macroareas' and 'locations' (mutable mappings of identifiers to values \
+    read from a `GeoTable`).
+    """
+    key = (SNAPSHOT_FORMAT, __version__, file_hash(newick), file_hash(geo))
+    path = snapshot_path(release)
+    res = None
+    if path.exists():
+        try:
+            res = read_snapshot(path, key, identifiers)
+        except Exception:  # pragma: no cover
+            # Corrupt or incompatible snapshot - just build a new one.
+            pass
+
+    if res is None:
+        index, families = build_snapshot(newick, geo)
+        try:
+            write_snapshot(path, key, index, families)
+        except OSError as e:  # pragma: no cover
+            log.info("Could not write Glottolog snapshot {0}: {1}".format(path, e))
+        if identifiers is not None:
+            families = [families[i] for i in sorted(select_families(index, identifiers))]
+        res = index, families
+
+    index, families = res
+    snapshot = dict(
+        classifications=Classifications(),
+        macroareas=index['geo'].view('macroareas'),
+        locations=index['geo'].view('locations'))
+    for family in families:
+        snapshot['classifications'].add_family(family)
+    return snapshot
@@ -2,22 +2,33 @@ import re
 
 import newick
 
-__all__ = ['classifications_from_newick', 'make_newick', 'make_structure', 'check_structure']
+__all__ = [
+    'parse_label', 'classifications_from_newick', 'make_newick', 'make_structure',
+    'check_structure']
 
 GLOTTOLOG_NODE_LABEL = re.compile(
     "'(?P<name>[^\[]+)\[(?P<glottocode>[a-z0-9]{8})\](\[(?P<isocode>[a-z]{3})\])?(?P<appendix>-l-)?'")
 
 
+def parse_label(label, label_pattern=GLOTTOLOG_NODE_LABEL):
+    """
+    Parse the label of a node in the Glottolog newick tree.
+
+    :return: `dict` with keys 'name', 'glottocode', 'isocode' and 'appendix'
+    """
+    match = {
+        k: v.strip() if v else '' for k, v in label_pattern.match(label).groupdict().items()}
+    assert match['glottocode']
+    match['name'] = match.get('name', '').strip().replace("\\'", "'")
+    return match
+
+
 def classifications_from_newick(string, label_pattern=GLOTTOLOG_NODE_LABEL):
     label2name = {}
 
-    def parse_label(label):
-        match = {
-            k: v.strip() if v else '' for k, v in label_pattern.match(label).groupdict().items()}
-        assert match['glottocode']
-        label2name[label] = (
-            match.get('name', '').strip().replace("\\'", "'"),
-            match['glottocode'])
+    def parse_node_label(label):
+        match = parse_label(label, label_pattern=label_pattern)
+        label2name[label] = (match['name'], match['glottocode'])
         return match
 
     def get_classification(node):
@@ -36,7 +47,7 @@ def classifications_from_newick(string, label_pattern=GLOTTOLOG_NODE_LABEL):
     trees = newick.read(string)
     for tree in trees:
         for node in tree.walk():
-            label = parse_label(node.name)
+            label = parse_node_label(node.name)
             classification = get_classification(node)
             classifications[label['glottocode']] = classification
             if label.get('isocode'):
@@ -51,15 +62,15 @@ def make_structure(classification, langs, depth, maxdepth):
     lists corresponding to their Glottolog classification.  The process
     may be halted part-way down the Glottolog tree.
 
-    :param classification: `dict` {glottocode: [(name, glottocode), ...]}
+    :param classification: `beastling.util.glottolog.Classifications` store
     """
     if depth > maxdepth:
         # We're done, so terminate recursion
         return langs
 
     def subgroup(name, depth):
-        ancestors = classification[name.lower()]
-        return ancestors[depth][0] if depth < len(ancestors) else ''
+        ancestor = classification.ancestor(name.lower(), depth)
+        return ancestor[0] if ancestor else ''
 
     def sortkey(i):
         """
@@ -1,9 +1,17 @@
 import re
 import functools
+import collections
+import weakref
+import contextlib
 from xml.etree import ElementTree as ET
+# We use the escaping of the standard library serializer, to produce identical output:
+from xml.etree.ElementTree import _escape_attrib, _escape_cdata
 
 ElementTree = ET.ElementTree
 
+# Size of the serialized chunks - in characters - passed to the output stream by `write`.
+CHUNK_SIZE = 1 << 16
+
 
 def valid_id(s):
     return re.sub('\s+', '_', s).replace(',', '_')
@@ -37,6 +45,92 @@ def _element(tag, **attrib):
 beast = functools.partial(_element, 'beast')
 
 
+# The registry of IDs and references of the document being built, if any.
+_registry = None
+
+
+class IdRegistry(object):
+    """
+    Registry of the IDs of BEAST objects in an XML document and of the references to them.
+
+    While a registry is active, the IDs and references of all elements created by `_subelement`
+    are registered - with plates expanded for the direct children of `<plate>` elements - and
+    duplicate IDs are reported as soon as they are created, naming the sections of the document
+    creating them.
+    """
+    def __init__(self):
+        # Maps IDs to the names of the sections which created them:
+        self.ids = {}
+        # References, with references in plates stored as triples (template, variable, range):
+        self.refs = set()
+        self._plate_refs = set()
+        # Maps the direct children of plates to pairs (variable, range):
+        self._plates = weakref.WeakKeyDictionary()
+        self.current_section = None
+
+    @contextlib.contextmanager
+    def activate(self):
+        global _registry
+        previous, _registry = _registry, self
+        try:
+            yield self
+        finally:
+            _registry = previous
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """
+        Attribute the IDs created within the context to a section, e.g. a model.
+        """
+        previous, self.current_section = self.current_section, name
+        try:
+            yield
+        finally:
+            self.current_section = previous
+
+    def register(self, elem, parent=None):
+        if parent is not None and parent.tag == 'plate':
+            self._plates[elem] = (
+                '$({0})'.format(parent.get('var')), tuple(parent.get('range').split(',')))
+        for attrib, value in elem.items():
+            self.register_attribute(elem, attrib, value)
+
+    def register_attribute(self, elem, attrib, value):
+        var, range_ = self._plates.get(elem, (None, None))
+        if attrib == 'id':
+            for id_ in [value] if var is None else [value.replace(var, v) for v in range_]:
+                self._add_id(id_)
+            return
+        if attrib == 'idref':
+            ref = value
+        elif value.startswith('@'):
+            ref = value[1:]
+        else:
+            return
+        if var is None or var not in ref:
+            self.refs.add(ref)
+        else:
+            self._plate_refs.add((ref, var, range_))
+
+    def _add_id(self, id_):
+        if id_ in self.ids:
+            raise ValueError("Duplicate BEASTObject ID found: {0}{1}".format(
+                id_,
+                ''.join(' ({0} {1})'.format(what, section) for what, section in [
+                    ('created in', self.current_section),
+                    ('previously created in', self.ids[id_])] if section)))
+        self.ids[id_] = self.current_section
+
+    def dangling_refs(self):
+        """
+        :return: The set of references to IDs which are not registered.
+        """
+        refs = set(self.refs)
+        for ref, var, range_ in self._plate_refs:
+            refs.update(ref.replace(var, v) for v in range_)
+        return refs - set(self.ids)
+
+
 def _subelement(tag, parent, text=None, attrib=None, **kw):
     """
     Append a child element to parent.
@@ -57,9 +151,21 @@ def _subelement(tag, parent, text=None, attrib=None, **kw):
         e = ET.SubElement(parent, tag, attrib=_string_attrib(attrib))
     if text is not None:
         e.text = _to_string(text)
+    if _registry is not None:
+        _registry.register(e, parent)
     return e
 
 
+def set_attribute(elem, name, value):
+    """
+    Set an attribute of an existing element, registering IDs and references like `_subelement`.
+    """
+    value = _to_string(value, name)
+    elem.set(name, value)
+    if _registry is not None:
+        _registry.register_attribute(elem, name, value)
+
+
 alignment = functools.partial(_subelement, 'alignment')
 branchratemodel = functools.partial(_subelement, 'branchratemodel')  # FIXME: check!
 branchRateModel = functools.partial(_subelement, 'branchRateModel')
@@ -107,3 +213,163 @@ var = functools.partial(_subelement, 'var')
 vfrequencies = functools.partial(_subelement, 'vfrequencies')
 weightvector = functools.partial(_subelement, 'weightvector')
 x = functools.partial(_subelement, 'x')
+
+
+# Names and numbers, i.e. maximal runs of word characters and dots:
+_TOKEN = re.compile(r'[\w.]+')
+
+
+def _substitution(value, var):
+    """
+    A function replacing all occurrences of a plate value in a string - which are not part of a
+    longer name or number - with the plate variable.
+    """
+    placeholder = '$({0})'.format(var)
+    # The common case - a value which is a token - doesn't need a regular expression per value.
+    token = _TOKEN.fullmatch(value)
+    pattern = _TOKEN if token else re.compile(r'(?<![\w.]){0}(?![\w.])'.format(re.escape(value)))
+
+    def repl(m):
+        return placeholder if not token or m.group() == value else m.group()
+
+    def sub(s):
+        return pattern.sub(repl, s) if value in s else s
+    return sub
+
+
+def _template(elem, sub):
+    """
+    The content of an element, with substitutions applied to the attribute values and texts, as
+    nested tuples.
+    """
+    return (
+        elem.tag,
+        tuple((name, sub(value)) for name, value in elem.items()),
+        sub(elem.text) if elem.text else elem.text,
+        elem.tail,
+        tuple(_template(child, sub) for child in elem))
+
+
+def _from_template(template):
+    tag, attrib, text, tail, children = template
+    elem = ET.Comment(text) if tag is ET.Comment else ET.Element(tag, dict(attrib))
+    elem.text, elem.tail = text, tail
+    elem.extend(_from_template(child) for child in children)
+    return elem
+
+
+def add_plates(parent, blocks, var):
+    """
+    Replace blocks of child elements of `parent` which differ only in the value of a plate
+    variable with a `<plate>`, i.e. with a single template for all values.
+
+    Since BEAST expands a plate by substituting the values for the variable in the template,
+    which reverses the construction of the template, only blocks which would be written exactly
+    as before are grouped.  Blocks without a group stay in place, and each plate is inserted in
+    place of the first block of its group.
+
+    :param parent: The parent element of the blocks.
+    :param blocks: Iterable of pairs (value, list of child elements of `parent`).
+    :param var: The name of the plate variable.
+    """
+    groups = collections.OrderedDict()
+    for value, elems in blocks:
+        # Plate ranges are comma-separated lists of valid IDs:
+        if not elems or valid_id(value) != value or '$(' in value:
+            continue
+        # Plates may be nested, but we don't want to shadow variables:
+        if any(e.tag == 'plate' for elem in elems for e in elem.iter()):
+            continue
+        sub = _substitution(value, var)
+        template = tuple(_template(elem, sub) for elem in elems)
+        groups.setdefault(template, []).append((value, elems))
+
+    plates, removed = {}, set()
+    for template, members in groups.items():
+        if len(members) > 1:
+            p = ET.Element('plate', var=var, range=','.join(value for value, _ in members))
+            p.extend(_from_template(t) for t in template)
+            plates[id(members[0][1][0])] = p
+            removed.update(id(e) for _, elems in members for e in elems)
+    if plates:
+        children = []
+        for child in parent:
+            if id(child) in plates:
+                children.append(plates[id(child)])
+            if id(child) not in removed:
+                children.append(child)
+        parent[:] = children
+
+
+def _blank(s):
+    return not s or not s.strip()
+
+
+def iterencode(root, encoding='UTF-8', pretty_print=True):
+    """
+    Serialize an XML document incrementally, without modifying the element tree.
+
+    The output is the same as the one of `ElementTree.write` with an XML declaration - after
+    indenting the tree with two spaces per level if `pretty_print` is `True`, i.e. replacing
+    blank text of elements with children and blank tails of elements with newlines plus
+    indentation.
+
+    :return: Generator of encoded chunks of the serialization.
+    """
+    pieces = ["<?xml version='1.0' encoding='{0}'?>\n".format(encoding)]
+    # The number of characters in `pieces`:
+    size = len(pieces[0])
+    if pretty_print and len(root) and _blank(root.tail):
+        tail = '\n'
+    else:
+        tail = root.tail
+    # A stack of pairs (element to open, tail) or (tag to close, tail), processed in document
+    # order:
+    stack = [((root, 0), tail)]
+    while stack:
+        if size > CHUNK_SIZE:
+            yield ''.join(pieces).encode(encoding, 'xmlcharrefreplace')
+            pieces, size = [], 0
+        item, tail = stack.pop()
+        if isinstance(item, str):
+            piece = '</{0}>'.format(item)
+        elif item[0].tag is ET.Comment:
+            piece = '<!--{0}-->'.format(item[0].text)
+        else:
+            elem, level = item
+            pieces.append('<' + elem.tag)
+            size += len(pieces[-1])
+            for k, v in elem.items():
+                pieces.append(' {0}="{1}"'.format(k, _escape_attrib(v)))
+                size += len(pieces[-1])
+            text = elem.text
+            if pretty_print and len(elem) and _blank(text):
+                text = '\n' + '  ' * (level + 1)
+            if text or len(elem):
+                piece = '>' + _escape_cdata(text) if text else '>'
+                pieces.append(piece)
+                size += len(piece)
+                stack.append((elem.tag, tail))
+                for i, child in reversed(list(enumerate(elem))):
+                    child_tail = child.tail
+                    if pretty_print and _blank(child_tail):
+                        # The last child is indented like the closing tag of its parent.
+                        child_tail = '\n' + '  ' * (level if i == len(elem) - 1 else level + 1)
+                    stack.append(((child, level + 1), child_tail))
+                continue
+            piece = ' />'
+        if tail:
+            piece += _escape_cdata(tail)
+        pieces.append(piece)
+        size += len(piece)
+    yield ''.join(pieces).encode(encoding, 'xmlcharrefreplace')
+
+
+def write(root, stream, **kw):
+    """
+    Write an XML document to a binary stream, chunk by chunk.
+
+    :param kw: Keyword arguments passed into `iterencode`.
+    """
+    for chunk in iterencode(root, **kw):
+        stream.write(chunk)
@@ -132,6 +132,15 @@ skip = [
             # robust eigensystem implementation.
             marks=pytest.mark.xfail),
         (("admin", "covarion_multistate", "pseudodollocovarion_fix_freq"), None),
+        (("admin", "mk", "plates"), None),
+        (("admin", "mk", "pruned", "plates"), None),
+        (("admin", "mk", "uniform_freqs", "plates"), None),
+        (("admin", "bsvs", "plates"), None),
+        (("admin", "covarion_multistate", "covarion_per_feature_params", "plates"), None),
+        (
+                ("admin", "covarion_multistate", "covarion_per_feature_params",
+                 "pseudodollocovarion", "plates"),
+                None),
         # Test that for 'log_fine_probs=True', probabilites are logged:
         (
                 ("admin", "covarion_multistate", "log_fine_probs"),
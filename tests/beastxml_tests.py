@@ -18,6 +18,10 @@ from beastling.beastxml import collect_ids_and_refs, BeastXml
         (
                 '<a attr="@b"><plate range="a" var="x"><e idref="thing$(x)"/></plate></a>',
                 lambda r: len(r['idref']) == 2 and len(r['id']) == 0),
+        (
+                '<plate range="a,b" var="x"><e id="e$(x)"><f id="f$(x)" r="@e$(x)"/></e></plate>',
+                lambda r: set(r['id']) == {'ea', 'eb', 'fa', 'fb'}
+                and set(r['idref']) == {'ea', 'eb'}),
     ]
 )
 def test_collect_ids_and_refs(xml, assertion):
@@ -32,6 +36,76 @@ def test_path_sampling(config_factory):
     bml.validate_ids()
 
 
+def test_ids_registered(config_factory, mocker):
+    config = config_factory('basic')
+    bml = BeastXml(config)
+    assert not bml.ids.dangling_refs()
+    assert set(bml.ids.ids) == set(collect_ids_and_refs(bml.beast)['id'])
+
+    # Duplicate IDs are reported when they are created:
+    mocker.patch.object(
+        config.models[0], 'add_misc', lambda beast: xml.data(beast, id='Tree.t:beastlingTree'))
+    with pytest.raises(ValueError, match='Duplicate.+MKModel'):
+        BeastXml(config)
+
+
+@pytest.mark.parametrize(
+    'configs',
+    [
+        ('basic',),
+        ('basic', 'pruned'),
+        ('covarion_multistate', 'covarion_per_feature_params'),
+        ('covarion_multistate', 'covarion_per_feature_params', 'pseudodollocovarion'),
+        ('bsvs',),
+    ]
+)
+def test_plates(config_factory, configs):
+    expanded = BeastXml(config_factory(*configs))
+    config = config_factory(*configs)
+    config.admin.plates = True
+    bml = BeastXml(config)
+    bml.validate_ids()
+    assert len(bml.beast.findall('.//plate')) > len(expanded.beast.findall('.//plate'))
+    assert len(bml.tostring()) < len(expanded.tostring())
+
+    # The plates define the same objects as the expanded document:
+    ids = collect_ids_and_refs(bml.beast)
+    assert set(bml.ids.ids) == set(ids['id'])
+    # (except for BSVS priors, which are numbered by feature unless plates are used)
+    if configs != ('bsvs',):
+        assert set(ids['id']) == set(collect_ids_and_refs(expanded.beast)['id'])
+
+
+def test_dangling_logger_refs(config_factory, mocker):
+    config = config_factory('basic')
+    config.admin.log_params = True
+    config.process()
+    model = config.models[0]
+    mocker.patch.object(model, 'add_param_logs', model.add_likelihood_loggers)
+    BeastXml(config)
+
+    # Logger entries referencing likelihoods which don't exist are reported:
+    config = config_factory('basic')
+    config.admin.log_params = True
+    config.process()
+    model = config.models[0]
+    mocker.patch.object(model, 'add_param_logs', model.add_likelihood_loggers)
+    mocker.patch.object(model, 'add_likelihood', lambda likelihood: None)
+    with pytest.raises(ValueError, match='missing.+featureLikelihood:model:f0'):
+        BeastXml(config)
+
+
+def test_add_taxon_set(config_factory):
+    bml = BeastXml(config_factory('basic'))
+    parent = xml.data(None)
+    bml.add_taxon_set(parent, 'x', ['aal', 'abf', 'aal'])
+    # The same languages - in any order - are referenced by the ID of the first TaxonSet:
+    bml.add_taxon_set(parent, 'y', ('abf', 'aal'))
+    assert [e.get('id') for e in parent] == ['x', None]
+    assert parent[1].get('idref') == 'x'
+    assert [e.get('idref') for e in parent[0]] == ['aal', 'abf']
+
+
 def test_validate_ids(config_factory):
     config = config_factory('basic')
 
@@ -0,0 +1,107 @@
+"""
+Benchmarks reproducing the timings quoted for performance-related changes.
+
+Run them with timings printed via
+
+    pytest -m slow --no-cov -s tests/benchmark_tests.py
+
+or as script - e.g. to compare the timings of two checkouts - from the root of the repository via
+
+    PYTHONPATH=. python tests/benchmark_tests.py [glottolog] [features]
+"""
+import sys
+import time
+import random
+import pathlib
+import tempfile
+from unittest import mock
+
+import pytest
+
+from beastling.configuration import Configuration
+
+pytestmark = pytest.mark.slow
+
+DATA = pathlib.Path(__file__).parent / 'data' / 'basic.csv'
+# Numbers of languages for the feature statistics benchmark.
+LANGUAGES = [500, 1000, 2000, 4000]
+
+
+def timed(func, *args, **kw):
+    start = time.perf_counter()
+    func(*args, **kw)
+    return time.perf_counter() - start
+
+
+def glottolog_timings(user_data_dir):
+    """
+    Time loading the bundled Glottolog 4.0 data - first compiling the snapshot in an empty user
+    data directory, then reading the snapshot.
+
+    :return: pair (cold, warm) of timings in seconds.
+    """
+    def load():
+        config = Configuration(
+            configfile={'admin': {}, 'model m': {'model': 'mk', 'data': str(DATA)}},
+            force_glottolog_load=True)
+        config.instantiate_models()
+        return timed(config.load_glottolog_data)
+
+    with mock.patch(
+            'beastling.util.glottolog.user_data_dir', lambda *args, **kw: str(user_data_dir)):
+        return load(), load()
+
+
+def write_random_data(path, languages, features=100, states=6, missing=0.1, seed=42):
+    rng = random.Random(seed)
+    rows = [','.join(['iso'] + ['f{0}'.format(i) for i in range(features)])]
+    for lang in range(languages):
+        rows.append(','.join(['l{0:05d}'.format(lang)] + [
+            '?' if rng.random() < missing else str(rng.randrange(states))
+            for _ in range(features)]))
+    path.write_text('\n'.join(rows), encoding='utf8')
+    return path
+
+
+def feature_properties_timings(directory, languages=LANGUAGES):
+    """
+    Time `compute_feature_properties` for 100 features of random 6-state data with 10% missing
+    data.
+
+    :return: `dict` mapping numbers of languages to timings in seconds.
+    """
+    res = {}
+    for n in languages:
+        data = write_random_data(pathlib.Path(str(directory)) / 'data{0}.csv'.format(n), n)
+        config = Configuration(configfile={
+            'admin': {},
+            'model m': {'model': 'mk', 'data': str(data), 'minimum_data': '0'}})
+        config.process()
+        res[n] = timed(config.models[0].compute_feature_properties)
+    return res
+
+
+def test_glottolog_snapshot(tmp_path):
+    cold, warm = glottolog_timings(tmp_path / 'cold')
+    print('\nLoading the bundled 4.0 data: {0:.2f}s cold, {1:.2f}s warm'.format(cold, warm))
+    assert warm < cold
+
+
+def test_feature_properties(tmp_path):
+    timings = feature_properties_timings(tmp_path)
+    print('\nlanguages  time')
+    for n, t in sorted(timings.items()):
+        print('{0:<9}  {1:.3f}s'.format(n, t))
+    # Counting is linear - not quadratic - in the number of languages:
+    assert timings[LANGUAGES[-1]] < timings[LANGUAGES[0]] * (LANGUAGES[-1] / LANGUAGES[0]) ** 2 / 2
+
+
+if __name__ == '__main__':  # pragma: no cover
+    benchmarks = sys.argv[1:] or ['glottolog', 'features']
+    with tempfile.TemporaryDirectory() as tmp:
+        if 'glottolog' in benchmarks:
+            print('Glottolog: {0:.2f}s cold, {1:.2f}s warm'.format(
+                *glottolog_timings(pathlib.Path(tmp) / 'user_data')))
+        if 'features' in benchmarks:
+            for n, t in sorted(feature_properties_timings(tmp).items()):
+                print('compute_feature_properties, {0} languages: {1:.3f}s'.format(n, t))
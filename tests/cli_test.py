@@ -1,4 +1,5 @@
 import os
+import gzip
 from pathlib import Path
 
 import pytest
@@ -69,3 +70,16 @@ def test_generate_extract(capsys, tmppath, config_dir, caplog):
     _run_main('--extract {0}'.format(xml))
     assert tcfg.exists()
     tcfg.unlink()
+
+
+def test_generate_compressed(tmppath, config_dir):
+    xml = tmppath / 'test.xml.gz'
+    _run_main('--compact -o {0} {1}'.format(xml, config_dir / 'basic.conf'))
+    with gzip.open(str(xml)) as fp:
+        content = fp.read()
+    # No indentation:
+    assert b'\n  <' not in content and content.count(b'\n') < 40
+    tcfg = Path('beastling_test.conf')
+    _run_main('--extract {0}'.format(xml))
+    assert tcfg.exists()
+    tcfg.unlink()
@@ -1,5 +1,6 @@
 import io
 import sys
+import collections
 from pathlib import Path
 import logging
 
@@ -9,6 +10,7 @@ import newick
 import beastling
 from beastling.configuration import Configuration, get_glottolog_data
 from beastling.beastxml import BeastXml
+from beastling.fileio import datareaders
 
 pytestmark = pytest.mark.slow
 
@@ -200,6 +202,76 @@ def test_calibration_string_formats(config_factory, cfg, dist, assertion):
         assert assertion(list(config.calibrations.values())[0])
 
 
+def test_stdin_data(config_dir, data_dir, mocker):
+    mocker.patch(
+        'beastling.fileio.datareaders.sys.stdin',
+        io.StringIO((data_dir / 'basic.csv').read_text(encoding='utf8')))
+    config = Configuration(
+        configfile=[str(config_dir / '{0}.conf'.format(n)) for n in ['multimodel', 'embed_data']],
+        stdin_data=True)
+    config.process()
+    # All models see the same data:
+    assert [len(m.data) for m in config.models] == [len(config.models[0].data)] * 2
+    assert config.models[0].data['aal'] == config.models[1].data['aal']
+    xml = BeastXml(config).tostring().decode('utf8')
+    assert xml.count('BEASTling embedded data file: stdin') == 2
+
+
+def test_jobs(config_dir, data_dir, mocker):
+    configfile = [
+        str(config_dir / '{0}.conf'.format(n))
+        for n in ['multimodel', 'geo', 'geo_user_loc_multifile']]
+    load = mocker.patch(
+        'beastling.fileio.datareaders._load_matrix', wraps=datareaders._load_matrix)
+    mocker.patch('beastling.fileio.datareaders._cache', collections.OrderedDict())
+    serial = Configuration(configfile=configfile)
+    serial.process()
+    assert load.call_count == 2
+    # The cached data is released once the models are instantiated:
+    assert not datareaders._cache
+
+    # Both data files are loaded by worker processes:
+    load.reset_mock()
+    mocker.patch('beastling.fileio.datareaders._cache', collections.OrderedDict())
+    parallel = Configuration(configfile=configfile, jobs=2)
+    assert parallel.admin.jobs == 2
+    parallel.process()
+    assert not load.called
+    assert [{k: dict(v) for k, v in m.data.items()} for m in parallel.models] \
+        == [{k: dict(v) for k, v in m.data.items()} for m in serial.models]
+    assert parallel.locations == serial.locations
+
+    # Errors are raised for the model section with the offending data file:
+    mocker.patch('beastling.fileio.datareaders._cache', collections.OrderedDict())
+    cfg = {
+        'admin': {'jobs': '2'},
+        'model a': {'model': 'mk', 'data': str(data_dir / 'basic.csv')},
+        'model b': {
+            'model': 'mk', 'data': str(data_dir / 'families.txt'), 'file_format': 'cldf-legacy'},
+    }
+    with pytest.raises(ValueError, match='CLDF standard'):
+        Configuration(configfile=cfg).process()
+    assert load.call_count == 1
+
+    with pytest.raises(ValueError, match='jobs'):
+        Configuration(configfile={'admin': {'jobs': '0'}, 'model a': {}})
+
+
+def test_sharded_data(data_dir, tmppath):
+    header, *rows = data_dir.joinpath('basic.csv').read_text(encoding='utf8').splitlines()
+    for i in range(2):
+        tmppath.joinpath('shard{0}.csv'.format(i)).write_text(
+            '\n'.join([header] + rows[i::2]), encoding='utf8')
+    config = Configuration(configfile={
+        'admin': {'embed_data': 'True'},
+        'model a': {'model': 'mk', 'data': str(tmppath / 'shard*.csv')},
+    })
+    config.process()
+    assert len(config.models[0].data) == len(rows)
+    xml = BeastXml(config).tostring().decode('utf8')
+    assert xml.count('BEASTling embedded data file') == 2
+
+
 def test_minimum_data(config_factory):
     # f8 has 60% missing data.  By default it should be included...
     config = _processed_config(config_factory, 'basic')
@@ -12,6 +12,25 @@ def tmppath(tmpdir):
     return Path(str(tmpdir))
 
 
+@pytest.fixture(scope='session')
+def glottolog_snapshots(tmp_path_factory):
+    # Compiling the Glottolog snapshot is slow, so tests share the snapshots built in this session.
+    return tmp_path_factory.mktemp('glottolog_snapshots')
+
+
+@pytest.fixture(autouse=True)
+def user_data_dir(tmp_path, monkeypatch, glottolog_snapshots):
+    # Caches must not be written to - or read from - the user's data directory.
+    path = tmp_path / 'user_data'
+    shutil.copytree(str(glottolog_snapshots), str(path))
+    for module in ['beastling.util.glottolog', 'beastling.fileio.datareaders']:
+        monkeypatch.setattr(module + '.user_data_dir', lambda *args, **kw: str(path))
+    yield path
+    for snapshot in path.glob('glottolog-*.pickle'):
+        if not (glottolog_snapshots / snapshot.name).exists():
+            shutil.copy(str(snapshot), str(glottolog_snapshots / snapshot.name))
+
+
 @pytest.fixture
 def tests_dir(tmppath):
     # Data files etc. are all referenced by paths in tests/ relative to the repos root.
@@ -0,0 +1,70 @@
+import pickle
+
+from beastling.fileio.datamatrix import DataMatrix, MISSING
+
+
+def test_datamatrix():
+    m = DataMatrix.from_dict({
+        'l1': {'f1': ['a'], 'f2': ['b', '-']},
+        'l2': {'f1': ['a']},
+        'l3': {'f1': ['c'], 'f3': ['?']},
+    })
+    assert m.features == ['f1', 'f2', 'f3']
+    assert m.cells('f1') == [('a',), ('c',)] and m.names[1] == ['b', '-']
+    assert list(m.cell_values('f2', 0)) == [0, 1] and m.value_code('f2', '-') == 1
+    assert list(m.column('f1')) == [0, 0, 1]
+    assert m.cell('l2', 'f2') is None and list(m.column('f2')) == [0, MISSING, MISSING]
+
+    data = m.view()
+    assert dict(data['l1']) == {'f1': ['a'], 'f2': ['b', '-']}
+    assert data['l2'].get('f2', ['?']) == ['?'] and 'f4' not in data['l2']
+    # Cells without data are indexed like in the `defaultdict`s data used to be read into:
+    assert data['l2']['f2'] == '?' and data['l2']['f4'] == '?' and 'f2' not in data['l2']
+    assert m.view(missing=[])['l2']['f2'] == []
+    assert len(data['l3']) == 2
+
+    m.recode('f2', lambda cell: [v for v in cell if v != '-'])
+    assert data['l1']['f2'] == ['b']
+
+    m.add_languages(['l4', 'l1'])
+    assert m.languages == ['l1', 'l2', 'l3', 'l4'] and not data['l4']
+
+    m.select(languages=['l3', 'l1'], features=['f1', 'f3'])
+    assert list(data) == ['l1', 'l3']
+    assert dict(data['l3']) == {'f1': ['c'], 'f3': ['?']}
+    assert pickle.loads(pickle.dumps(m)).view()['l3']['f1'] == ['c']
+
+
+def test_bincount():
+    m = DataMatrix.from_dict({'l1': {'f': ['a']}, 'l2': {'f': ['b']}, 'l3': {'f': ['a']}, 'l4': {}})
+    assert m.bincount('f') == ([2, 1], 1)
+
+
+def test_value_counts():
+    m = DataMatrix.from_dict({'l1': {'f': ['a', 'b']}, 'l2': {'f': ['b']}, 'l3': {'f': ['a', 'b']}})
+    assert m.names[0] == ['a', 'b'] and m.value_counts('f') == [2, 3]
+    assert list(m.flat[0]) == [0, 1, 1] and list(m.offsets[0]) == [0, 2, 3]
+    m.set('l2', 'f', ['a', 'b'])
+    m.set('l3', 'f', ['b', 'a'])
+    assert list(m.column('f')) == [0, 0, 2] and m.cells('f')[2] == ('b', 'a')
+
+
+def test_copy():
+    m = DataMatrix.from_dict({'l1': {'f': ['a']}, 'l2': {'f': ['b']}})
+    c = m.copy()
+    c.set('l1', 'f', ['c'])
+    c.recode('f', lambda cell: [v.upper() for v in cell])
+    assert m.cells('f') == [('a',), ('b',)] and m.view()['l1']['f'] == ['a']
+    assert c.view()['l1']['f'] == ['C']
+    m.set('l2', 'f', ['d'])
+    assert c.view()['l2']['f'] == ['B']
+
+
+def test_sparse_binarisation():
+    from beastling.models.binary import SparseBinarisation
+
+    m = DataMatrix.from_dict({'l1': {'f': ['b', 'a', 'b']}, 'l2': {'f': ['?', 'c']}, 'l3': {}})
+    binarised = SparseBinarisation(m, 'f', {'a': 0, 'b': 1, 'c': 2}, ['0'])
+    assert [list(binarised.present(code)) for code in range(2)] == [[0, 1], [2]]
+    assert [binarised[code] for code in [0, 1, MISSING]] == ['0110', '0??1', '0???']
+    assert binarised.frequencies([2, 1], 4) == (4, 4)
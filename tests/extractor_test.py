@@ -1,5 +1,6 @@
 import re
 import os
+import gzip
 import pathlib
 
 from clldutils.path import Path, remove
@@ -44,6 +45,13 @@ def test_extractor(config_factory, tmppath, data_dir):
     xml.write_file(xmlfile)
     assert bool(_extract(xmlfile))
 
+    # Compressed and compact XML files are read transparently:
+    xmlfile = tmppath / "beastling.xml.gz"
+    xml.write_file(xmlfile, compact=True)
+    with gzip.open(str(xmlfile)) as fp:
+        assert fp.read() == xml.tostring(compact=True)
+    assert bool(_extract(xmlfile))
+
     config = config_factory({
             'admin': {'basename': 'abcdefg'},
             'model model': {
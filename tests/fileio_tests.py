@@ -1,12 +1,16 @@
+import json
 import logging
 from io import StringIO
 
 import pytest
-from pycldf import Wordlist, Generic
+from pycldf import Wordlist, Generic, StructureDataset
+from pycldf.db import Database
 
 import beastling
+from beastling.util.fileio import open_file
 from beastling.fileio.datareaders import (
-    load_data, sniff, build_lang_ids, read_cldf_dataset, iterlocations,
+    load_data, load_matrix, sniff, build_lang_ids, read_cldf_dataset, read_cldf_sqlite,
+    iterlocations, shard_files,
 )
 
 @pytest.fixture
@@ -93,11 +97,170 @@ def test_load_data(data_dir):
                 assert len(data) != 0
 
 
+@pytest.mark.parametrize('module', [Wordlist, StructureDataset])
+def test_read_cldf_sqlite(tmppath, module):
+    ds = module.in_dir(tmppath / 'cldf')
+    ds.add_component('LanguageTable')
+    ds.add_component('ParameterTable')
+    langs = [dict(ID=lang, Name=lang + ' name') for lang in 'abc']
+    params = [dict(ID=p, Name=p.upper()) for p in 'pq']
+    rows = [
+        dict(ID=str(i), Language_ID=lang, Parameter_ID=p, Form='f', Value=str(i % 3))
+        for i, (lang, p) in enumerate([(lang, p) for lang in 'abc' for p in 'pq'] * 2)]
+    if module == Wordlist:
+        ds.add_component('CognateTable')
+        data = dict(FormTable=rows, CognateTable=[
+            dict(ID=str(i), Form_ID=row['ID'], Cognateset_ID=row['Value'])
+            for i, row in enumerate(rows) if row['ID'] != '1'])
+    else:
+        data = dict(ValueTable=rows)
+    ds.write(LanguageTable=langs, ParameterTable=params, **data)
+    db, md = tmppath / 'cldf.sqlite', tmppath / 'cldf' / '{0}-metadata.json'.format(module.__name__)
+    Database(ds, fname=db).write_from_tg()
+
+    for kw in [
+        dict(),
+        dict(languages={'a_name', 'c_name'}, features={'P'}),
+        dict(exclusions={'P'}, cognatesets={'1'}),
+    ]:
+        for expect_multiple in [True, False]:
+            assert read_cldf_sqlite(db, expect_multiple=expect_multiple, **kw) == \
+                read_cldf_dataset(md, expect_multiple=expect_multiple, **kw)
+    assert load_data(db, file_format='cldf-sqlite', languages={'b_name'})[0] == \
+        read_cldf_dataset(md, languages={'b_name'})[0]
+
+    if module == Wordlist:
+        with pytest.raises(ValueError):
+            read_cldf_sqlite(db, code_column='x')
+    with pytest.raises(FileNotFoundError):
+        read_cldf_sqlite(tmppath / 'x.sqlite')
+
+
+def test_read_cldf_sqlite_optional_columns(tmppath):
+    # Names and Glottocodes of languages and names of parameters are optional in CLDF.
+    ds = StructureDataset.in_dir(tmppath / 'cldf')
+    for component, column in [('LanguageTable', 'Glottocode'), ('ParameterTable', 'Name')]:
+        ds.add_component(component)
+        ds[component].tableSchema.columns = [
+            col for col in ds[component].tableSchema.columns if col.name != column]
+    ds.write(
+        LanguageTable=[dict(ID=lang, Name=lang + ' name') for lang in 'ab'],
+        ParameterTable=[dict(ID=p) for p in 'pq'],
+        ValueTable=[
+            dict(ID=lang + p, Language_ID=lang, Parameter_ID=p, Value='1')
+            for lang in 'ab' for p in 'pq'])
+    db = tmppath / 'cldf.sqlite'
+    Database(ds, fname=db).write_from_tg()
+
+    data, language_code_map = read_cldf_sqlite(db)
+    assert data == read_cldf_dataset(tmppath / 'cldf' / 'StructureDataset-metadata.json')[0]
+    assert list(data) == ['a_name', 'b_name'] and list(data['a_name']) == ['p', 'q']
+    assert language_code_map == {}
+
+
+@pytest.mark.parametrize(
+    'fname,kw', [('basic.csv', {}), ('cldf.csv', dict(file_format='cldf-legacy'))])
+def test_load_data_filtered(data_dir, fname, kw):
+    data, _ = load_data(data_dir / fname, **kw)
+    filtered, _ = load_data(
+        data_dir / fname, features={'f1', 'f2', 'f3'}, exclusions={'f3'}, languages={'aal'}, **kw)
+    assert set(filtered['aal']) == {'f1', 'f2'}
+    assert filtered['aal']['f1'] == data['aal']['f1']
+    assert set(filtered) == {'aal'}
+
+
+@pytest.mark.parametrize(
+    'fname,kw',
+    [
+        ('Wordlist-metadata.json', {}),
+        ('Wordlist-with-languages-table-metadata.json', {}),
+        ('StructureDataset-metadata.json', {}),
+        ('forms.csv', dict(code_column='Cognate_Set')),
+    ]
+)
+def test_read_cldf_dataset_filtered(data_dir, fname, kw):
+    data, _ = read_cldf_dataset(data_dir / fname, expect_multiple=True, **kw)
+    lang, other = list(data)[:2]
+    feature = list(data[lang])[0]
+    filtered, _ = read_cldf_dataset(
+        data_dir / fname, expect_multiple=True, languages={lang, other},
+        features={feature}, exclusions={'x'}, **kw)
+    assert list(filtered) == [lang, other]
+    assert filtered[lang] == {feature: data[lang][feature]}
+    assert set(filtered[other]) <= {feature}
+
+    filtered, _ = read_cldf_dataset(
+        data_dir / fname, expect_multiple=True, languages={lang}, cognatesets=set(), **kw)
+    assert list(filtered) == [lang] and not any(filtered[lang].values())
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_load_sharded_data(data_dir, tmppath, jobs):
+    header, *rows = data_dir.joinpath('basic.csv').read_text(encoding='utf8').splitlines()
+    shards = tmppath / 'shards'
+    shards.mkdir()
+    for i, fname in enumerate(['a.csv', 'b.csv', 'c.txt']):
+        shards.joinpath(fname).write_text(
+            '\n'.join([header] + rows[i::3]), encoding='utf8')
+    data, _ = load_data(data_dir / 'basic.csv', languages={'aal', 'abf'}, expect_multiple=True)
+    assert len(data) == 2
+    for source in [shards, shards / '*.*']:
+        assert shard_files(source) == [shards / 'a.csv', shards / 'b.csv', shards / 'c.txt']
+        sharded, _ = load_data(
+            source, languages={'aal', 'abf'}, expect_multiple=True, jobs=jobs)
+        assert sharded == {k: dict(v) for k, v in data.items()}
+    assert shard_files(data_dir / 'basic.csv') is None
+
+    shards.joinpath('d.csv').write_text('\n'.join([header, rows[0]]), encoding='utf8')
+    with pytest.raises(ValueError, match="Duplicated language identifier .+d.csv"):
+        load_data(shards, jobs=jobs)
+    with pytest.raises(ValueError, match="No data files"):
+        load_data(shards / '*.tsv', jobs=jobs)
+
+
+def test_load_ragged_data(tmppath):
+    fname = tmppath / 'data.csv'
+    fname.write_text('f1,f2,iso\n1,2,aal\n1,2\n', encoding='utf8')
+    with pytest.raises(ValueError, match='Missing language identifier in line 3'):
+        load_data(fname)
+
+
+def test_load_cldf_directory(data_dir, tmppath):
+    # A directory containing CLDF metadata is read as dataset - not as shards:
+    md = 'Wordlist-with-languages-table-metadata.json'
+    for fname in [md, 'cldf.csv', 'languages.csv', 'cognatesets.csv']:
+        tmppath.joinpath(fname).write_bytes(data_dir.joinpath(fname).read_bytes())
+    assert load_data(tmppath) == load_data(data_dir / md)
+
+    tmppath.joinpath('StructureDataset-metadata.json').write_text('{}', encoding='utf8')
+    with pytest.raises(ValueError, match='multiple CLDF metadata'):
+        load_data(tmppath)
+
+
+def test_load_matrix(data_dir, tmppath, mocker):
+    fname = tmppath / 'data.csv'
+    fname.write_text((data_dir / 'basic.csv').read_text(encoding='utf8'), encoding='utf8')
+    load = mocker.patch('beastling.fileio.datareaders.load_data', wraps=load_data)
+    m1, _ = load_matrix(fname, expect_multiple=True, features={'f1'})
+    m2, _ = load_matrix(fname, expect_multiple=True, features=['f1'])
+    assert load.call_count == 1
+    m1.select(languages=['aal'])
+    assert m1.view() != m2.view() and 'aas' in m2.view()
+
+    # Changing the file invalidates the cache:
+    fname.write_text('iso,f1\naal,1\n', encoding='utf8')
+    m3, _ = load_matrix(fname, expect_multiple=True, features={'f1'})
+    assert load.call_count == 2 and list(m3.view()) == ['aal']
+
+
 def test_load_data_from_stdin(mocker, data_dir):
     filename = data_dir / 'basic.csv'
     mocker.patch(
         'beastling.fileio.datareaders.sys.stdin', StringIO(filename.read_text(encoding='utf8')))
     assert load_data('stdin') == load_data(filename)
+    # Data from stdin can be read repeatedly:
+    assert load_data('stdin') == load_data(filename)
+    assert load_matrix('stdin')[0].view() == load_matrix(filename)[0].view()
 
 
 def test_load_cldf_data_from_stdin(mocker, data_dir):
@@ -171,3 +334,80 @@ def test_iterlocations_missing_column(tmppath):
 def test_iterlocations_invalid_coords(tmppath):
     tmppath.joinpath('locs').write_text('iso,lat,lon\nabc,2.2,xy', encoding='utf8')
     assert list(iterlocations(tmppath.joinpath('locs')))[0][1][1] == '?'
+
+
+@pytest.mark.parametrize('suffix', ['.gz', '.xz', '.bz2'])
+@pytest.mark.parametrize(
+    'fnames,kw',
+    [
+        (['basic.csv'], {}),
+        (['cldf.tsv'], dict(file_format='cldf-legacy')),
+        (['forms.csv'], dict(value_column='Cognate_Set')),
+        # The metadata refers to the uncompressed tables:
+        (
+            ['Wordlist-with-languages-table-metadata.json', 'cldf.csv', 'languages.csv',
+             'cognatesets.csv'],
+            {}),
+    ]
+)
+def test_load_compressed_data(data_dir, tmppath, fnames, kw, suffix):
+    for fname in fnames:
+        with open_file(tmppath / (fname + suffix), 'wb') as fp:
+            fp.write(data_dir.joinpath(fname).read_bytes())
+    assert load_data(tmppath / (fnames[0] + suffix), **kw) == load_data(data_dir / fnames[0], **kw)
+    # Metadata is decompressed in memory:
+    assert not list(tmppath.glob('*.json'))
+
+
+def test_load_compressed_metadata_invalid(tmppath):
+    with open_file(tmppath / 'Wordlist-metadata.json.gz', 'wt') as fp:
+        fp.write('{"tables": [')
+    with pytest.raises(ValueError):
+        load_data(tmppath / 'Wordlist-metadata.json.gz')
+    assert not list(tmppath.glob('*.json'))
+
+
+def test_iterlocations_compressed(data_dir, tmppath):
+    with open_file(tmppath / 'locs.csv.gz', 'wb') as fp:
+        fp.write(data_dir.joinpath('location_data.csv').read_bytes())
+    assert list(iterlocations(tmppath / 'locs.csv.gz')) \
+        == list(iterlocations(data_dir / 'location_data.csv'))
+
+
+def test_sniffer_cache(data_dir, tmppath, mocker):
+    mocker.patch(
+        'beastling.fileio.datareaders.user_data_dir', mocker.Mock(return_value=str(tmppath)))
+    mocker.patch('beastling.fileio.datareaders._sniffer_cache', None)
+    fname = data_dir / 'cldf.tsv'
+    dialect = sniff(fname)
+    cache_path = tmppath.joinpath('sniffer-cache.json')
+    cache = json.loads(cache_path.read_text(encoding='utf8'))
+    assert len(cache) == 1
+
+    # Entries written by other processes in the meantime are kept:
+    cache['other'] = next(iter(cache.values()))
+    cache_path.write_text(json.dumps(cache), encoding='utf8')
+    sniff(data_dir / 'basic.csv')
+    assert len(json.loads(cache_path.read_text(encoding='utf8'))) == 3
+    assert not list(tmppath.glob('*.tmp'))
+    large = tmppath / 'large.tsv'
+    large.write_text('lang\tfeature\n' + 'l\tf\n' * 1000, encoding='utf8')
+    assert sniff(large).delimiter == '\t'
+
+    # The cached dialect is used - even across processes:
+    mocker.patch('beastling.fileio.datareaders._sniffer_cache', None)
+    sniffer = mocker.patch('beastling.fileio.datareaders.csv.Sniffer')
+    assert sniff(fname).delimiter == dialect.delimiter == '\t'
+    # The cache is keyed on the beginning of the file only:
+    with large.open('a', encoding='utf8') as fp:
+        fp.write('l\tg\n')
+    assert sniff(large).delimiter == '\t'
+    assert not sniffer.called
+
+    # Explicit options bypass the sniffer:
+    fname = tmppath / 'data.txt'
+    fname.write_text('iso;f1\naal;ä\n', encoding='latin1')
+    assert sniff(fname, delimiter=';').delimiter == ';'
+    assert not sniffer.called
+    data, _ = load_data(fname, delimiter=';', encoding='latin1')
+    assert data['aal']['f1'] == 'ä'
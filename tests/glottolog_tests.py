@@ -0,0 +1,102 @@
+import pytest
+
+from beastling.util import glottolog
+
+
+@pytest.fixture
+def glottolog_files(tmppath, mocker):
+    mocker.patch(
+        'beastling.util.glottolog.user_data_dir', mocker.Mock(return_value=str(tmppath / 'cache')))
+    newick = tmppath / 'glottolog-x.newick'
+    newick.write_text(
+        "(('Dia [dial1234]':1)'Lang [lang1234][lan]-l-':1)'Fam [fami1234]':1;\n"
+        "('Iso [isol1234][iso]-l-':1)'Iso [isol1234][iso]-l-':1;\n",
+        encoding='utf8')
+    geo = tmppath / 'glottolog-x-geo.csv'
+    geo.write_text(
+        "glottocode,name,isocodes,level,macroarea,latitude,longitude\n"
+        "lang1234,Lang,lan,language,Eurasia,1.5,2.5\n"
+        "dial1234,Dia,,dialect,,,\n"
+        "isol1234,Iso,iso,language,Africa,,\n",
+        encoding='utf8')
+    return newick, geo
+
+
+def test_snapshot(glottolog_files, mocker):
+    snapshot = glottolog.load_snapshot(*glottolog_files, release='x')
+    assert snapshot['classifications']['lan'] == [('Fam', 'fami1234')]
+    assert snapshot['classifications']['dial1234'] == [('Fam', 'fami1234'), ('Lang', 'lang1234')]
+    assert snapshot['macroareas']['iso'] == 'Africa'
+    assert snapshot['locations']['lan'] == (1.5, 2.5)
+    # Dialects inherit geographic data from their ancestors:
+    assert snapshot['locations']['dial1234'] == (1.5, 2.5)
+    assert snapshot['macroareas']['dial1234'] == 'Eurasia'
+    assert glottolog.snapshot_path('x').exists()
+
+    # The second load must not parse the source files again ...
+    build = mocker.patch(
+        'beastling.util.glottolog.build_snapshot', wraps=glottolog.build_snapshot)
+    assert glottolog.load_snapshot(*glottolog_files, release='x') == snapshot
+    assert not build.called
+
+    # ... unless they changed.
+    glottolog_files[1].write_text(
+        glottolog_files[1].read_text(encoding='utf8') + "xxxx1234,X,,language,,,\n",
+        encoding='utf8')
+    glottolog.load_snapshot(*glottolog_files, release='x')
+    assert build.called
+
+
+def test_snapshot_families(glottolog_files):
+    snapshot = glottolog.load_snapshot(*glottolog_files, release='x', identifiers=['Lang'])
+    assert 'lan' in snapshot['classifications'] and 'iso' not in snapshot['classifications']
+    # Geographic data is not restricted:
+    assert 'iso' in snapshot['macroareas']
+
+    # Reading the families from a snapshot gives the same result as building them:
+    for identifiers in [['ISO', 'nope'], None]:
+        assert glottolog.load_snapshot(*glottolog_files, release='x', identifiers=identifiers) \
+            == glottolog.load_snapshot(*glottolog_files, release='x', identifiers=identifiers)
+    snapshot = glottolog.load_snapshot(*glottolog_files, release='x', identifiers=['ISO', 'nope'])
+    assert list(snapshot['classifications']) == ['isol1234', 'iso']
+
+
+def test_classifications(glottolog_files):
+    c = glottolog.load_snapshot(*glottolog_files, release='x')['classifications']
+    assert len(c) == 6
+    # Family roots are classified as themselves, isolates as their family:
+    assert c['fami1234'] == [('Fam', 'fami1234')]
+    assert c['iso'] == [('Iso', 'isol1234')]
+    assert c.depth('dial1234') == 2 and c.depth('iso') == 1
+    assert c.family('dial1234') == 'Fam'
+    assert c.ancestor('dial1234', 1) == ('Lang', 'lang1234')
+    assert c.ancestor('dial1234', 2) is None
+    for i in c:
+        assert [c.ancestor(i, depth) for depth in range(c.depth(i) + 1)] == c[i] + [None]
+    assert c.in_clades('dial1234', {'lang1234'})
+    assert c.in_clades('dial1234', {'fam'}, lowercase=True)
+    assert not c.in_clades('dial1234', {'fam'})
+    assert not c.in_clades('unknown', {'fam'})
+    for clades in [{'Fam'}, {'lang1234'}, {'isol1234'}, {'dial1234'}]:
+        assert {c.node(i) for i in c if c.in_clades(i, clades)} \
+            == c.descendants(clades).intersection(c.node(i) for i in c)
+    index = c.clade_index(['dial1234', 'LAN', 'iso', 'unknown'])
+    assert index['fam'] == index['fami1234'] == {'dial1234', 'LAN'}
+    assert index['lang'] == {'dial1234'} and index['iso'] == {'iso'}
+    c.add_alias('My Dialect', 'dial1234')
+    assert c['My Dialect'] == c['dial1234']
+
+
+def test_geo_table(glottolog_files):
+    geo = glottolog.GeoTable.from_csv(glottolog_files[1])
+    assert geo.level(geo.rows['dial1234']) == 'dialect'
+    assert geo.location(geo.rows['lan']) == (1.5, 2.5) and geo.location(geo.rows['iso']) is None
+
+    locations = geo.view('locations')
+    assert set(locations) == {'lang1234', 'lan'}
+    locations['iso'] = (0.0, 0.0)
+    del locations['lan']
+    assert 'lan' not in locations and locations['iso'] == (0.0, 0.0)
+    assert geo.location(geo.rows['iso']) is None
+    with pytest.raises(KeyError):
+        del locations['dial1234']
@@ -1,4 +1,5 @@
 from beastling.configuration import get_glottolog_data
+from beastling.util.glottolog import load_snapshot
 
 from beastling.util.monophyly import *
 
@@ -10,7 +11,9 @@ def test_trivial():
 
 
 def test_glottolog():
-    c, _, _ = classifications_from_newick(str(get_glottolog_data('newick', '4.0')))
+    c = load_snapshot(
+        get_glottolog_data('newick', '4.0'), get_glottolog_data('geo', '4.0'), '4.0',
+        identifiers=['olde1238', 'sate1242', 'hind1273', 'schi1234'])['classifications']
     struct = make_structure(c, ['olde1238', 'sate1242', 'hind1273', 'schi1234'], 0, 9)
     assert check_structure(struct)
     assert make_newick(struct) == '(((hind1273,schi1234),sate1242),olde1238)'
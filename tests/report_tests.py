@@ -10,3 +10,12 @@ def test_report(config_factory):
 def test_geojson(config_factory):
     config = config_factory('admin', 'basic', 'calibration')
     _ = BeastlingGeoJSON(config)
+
+
+def test_geojson_subfamilies(config_factory):
+    # All languages are Austronesian, so they are classified by subfamily:
+    config = config_factory('admin', 'basic', 'families')
+    geojson = BeastlingGeoJSON(config).geojson
+    assert {f['properties']['family'] for f in geojson['features']} == {'Austronesian'}
+    assert sorted(f['properties']['subfamily'] for f in geojson['features']) == [
+        'Central-Eastern Malayo-Polynesian', 'North Borneo Malayo-Polynesian']
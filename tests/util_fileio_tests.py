@@ -6,3 +6,16 @@ from beastling.util import fileio
 def test_missing_file():
     with pytest.raises(ValueError):
         list(fileio.iterlines('xyz'))
+
+
+@pytest.mark.parametrize('suffix', ['', '.gz', '.xz', '.bz2'])
+def test_open_file(tmppath, suffix):
+    fname = tmppath / ('test.csv' + suffix)
+    with fileio.open_file(fname, 'w', encoding='utf8') as fp:
+        fp.write('äöü\n')
+    assert fileio.uncompressed_name(fname).name == 'test.csv'
+    assert fileio.is_compressed(fname) == bool(suffix)
+    if suffix:
+        assert fname.read_bytes() != 'äöü\n'.encode('utf8')
+    with fileio.open_file(fname, encoding='utf8') as fp:
+        assert fp.read() == 'äöü\n'
@@ -1,8 +1,27 @@
+import io
+
 import pytest
 
 from beastling.util import xml
 
 
+def indent(elem, level=0):
+    # Reference implementation of the indentation emulated by `iterencode`.
+    i = "\n" + level*"  "
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + "  "
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for elem in elem:
+            indent(elem, level+1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+
 @pytest.mark.parametrize(
     'kw,assertion',
     [
@@ -32,3 +51,93 @@ def test_nesting():
     xml.run(xml.beast())
     for ee in e:
         assert ee.tag == 'run'
+
+
+@pytest.mark.parametrize(
+    'doc',
+    [
+        '<a/>',
+        '<a>text</a>',
+        '<a x="1" y="&quot;\n&lt;"><b>t &amp; u</b>tail<c> </c><!-- comment --><d><e/></d></a>',
+        '<a>\n<b/> <c><d/>x</c></a>',
+    ]
+)
+def test_iterencode(doc, mocker):
+    mocker.patch('beastling.util.xml.CHUNK_SIZE', 5)
+    root = xml.ET.fromstring(
+        doc, parser=xml.ET.XMLParser(target=xml.ET.TreeBuilder(insert_comments=True)))
+    unindented = xml.ET.tostring(root)
+    res = b''.join(xml.iterencode(root))
+    # The element tree is not modified, but serialized as if indented:
+    assert xml.ET.tostring(root) == unindented
+    out = io.BytesIO()
+    indent(root)
+    xml.ElementTree(root).write(out, encoding='UTF-8', xml_declaration=True)
+    assert res == out.getvalue()
+
+    out = io.BytesIO()
+    xml.write(xml.ET.fromstring(doc), out, pretty_print=False)
+    assert out.getvalue().endswith(xml.ET.tostring(xml.ET.fromstring(doc)))
+
+
+@pytest.mark.parametrize('pretty_print', [True, False])
+def test_iterencode_chunks(pretty_print):
+    root = xml.beast()
+    data = xml.data(root, id='data')
+    for i in range(500):
+        xml.sequence(data, id='s{0}'.format(i), taxon='t{0}'.format(i), value='0,1,?,' * 1000)
+    chunks = list(xml.iterencode(root, pretty_print=pretty_print))
+    assert len(chunks) > 1
+    # Chunks exceed the chunk size by at most one element:
+    assert max(len(c) for c in chunks) < xml.CHUNK_SIZE + 6100
+    assert len(xml.ET.fromstring(b''.join(chunks))[0]) == 500
+
+
+def test_id_registry():
+    registry = xml.IdRegistry()
+    root = xml.beast()
+    xml.data(root, id='outside')
+    with registry.activate():
+        xml.data(root, id='a')
+        plate = xml.plate(root, var='x', range=['b', 'c'])
+        xml.data(plate, id='$(x)', ref='@a')
+        xml.data(xml.data(plate, idref='d$(x)'), idref='e$(x)')
+        xml.set_attribute(xml.data(plate), 'data', '@f$(x)')
+        with registry.section('Model m'):
+            xml.data(root, id='d')
+            with pytest.raises(ValueError, match=r'Duplicate .+: b \(created in Model m\)'):
+                xml.data(root, id='b')
+    assert set(registry.ids) == {'a', 'b', 'c', 'd'}
+    assert registry.ids['d'] == 'Model m'
+    assert registry.dangling_refs() == {'db', 'dc', 'e$(x)', 'fb', 'fc'}
+
+
+def test_add_plates():
+    parent = xml.beast()
+    blocks = []
+    for value, dim in [('1', 2), ('2', 3), ('x', 2), ('y', 3), ('a b', 2)]:
+        elems = [
+            xml.parameter(parent, id='p:{0}'.format(value), dimension=dim, text='1.0'),
+            xml.prior(parent, x='@p:{0}'.format(value))]
+        blocks.append((value, elems))
+    xml.data(parent, id='other')
+    xml.add_plates(parent, blocks, 'f')
+
+    assert [e.tag for e in parent] == ['plate', 'plate', 'parameter', 'prior', 'data']
+    assert [p.get('range') for p in parent[:2]] == ['1,x', '2,y']
+    # Numbers and longer names containing the value are not substituted:
+    assert parent[0][0].attrib == {'id': 'p:$(f)', 'dimension': '2'}
+    assert parent[0][0].text == '1.0'
+    assert parent[0][1].get('x') == '@p:$(f)'
+    # Expanding the plates reproduces the blocks:
+    expanded_plates = xml.beast()
+    for e in parent:
+        if e.tag == 'plate':
+            for value in e.get('range').split(','):
+                for t in e:
+                    expanded_plates.append(xml.ET.fromstring(
+                        xml.ET.tostring(t).replace(b'$(f)', value.encode())))
+    assert sorted(xml.ET.tostring(e) for e in expanded_plates) \
+        == sorted(xml.ET.tostring(e) for _, elems in blocks[:4] for e in elems)
+    # Blocks with values which are not valid IDs are left alone:
+    assert parent[3].get('x') == '@p:a b'